@@ -6,10 +6,16 @@
 from . import entities
 from .entities import NebulaNetwork, NebulaNode
 
+backends = entities._backends
 deploy = entities._deploy
 io = entities._io
 base = entities._base
 config = entities._config
+inventory = entities._inventory
+ipam = entities._ipam
+pki = entities._pki
+query = entities._query
+table = entities._table
 
 from .config import RoutableIPPort
 from .deploy import export
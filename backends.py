@@ -0,0 +1,246 @@
+"""Certificate signing backends of `NebulaNetwork`.
+
+A backend creates the network CA and signs node certificates, writing them to the `io.ca_outputs` and
+`io.node_outputs` paths. Pick the fastest one available in an environment with the `NebulaNetwork.backend`
+field:
+
+```python
+net = NebulaNetwork(cert_authority="My CA", ip="10.100.0.0", nodes=nodes, backend=SubprocessBackend())
+```
+
+- `DockerBackend` (default): `nebula-cert` in the `nebulaoss/nebula` image, one container per node, batched
+  in one container, run on a thread pool or through a warm worker container.
+- `SubprocessBackend`: a local `nebula-cert` binary, signing many nodes on a process pool.
+- `InProcessBackend`: `pki`, no `nebula-cert` at all.
+- `RecordingBackend`: records calls and writes nothing, to measure or test orchestration alone.
+"""
+
+import shlex
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional
+
+from . import io as _io
+from . import pki as _pki
+
+
+class SigningBackend:
+    """Base class of signing backends. Subclasses implement `network_cert` and `sign_node`, and may override
+    `sign_nodes` to sign many nodes more efficiently than one at a time."""
+
+    def network_cert(self, network, overwrite=False):
+        """Create the CA of `network` unless its outputs exist."""
+        raise NotImplementedError
+
+    def sign_node(self, network, node, overwrite=False):
+        """Sign the certificate of `node` unless its outputs exist, creating the CA first if needed.
+
+        Raises:
+            ValueError: Some of the node outputs exist but not all of them, or signing failed.
+        """
+        raise NotImplementedError
+
+    def qr_code(self, network, cert, qr):
+        """Render the existing certificate `cert` of `network` as the QR code image `qr`.
+
+        Raises:
+            ValueError: Rendering failed.
+        """
+        raise NotImplementedError
+
+    def sign_result(self, network, node, overwrite=False) -> _io.SignResult:
+        """`sign_node` reporting its outcome as an `io.SignResult` instead of raising."""
+        try:
+            self.sign_node(network, node, overwrite=overwrite)
+        except Exception as e:
+            return _io.SignResult(node.name, False, str(e))
+        return _io.SignResult(node.name, True)
+
+    def sign_nodes(self, network, nodes: Iterable, overwrite=False) -> List[_io.SignResult]:
+        """Sign the certificates of `nodes`, returning one `io.SignResult` per node in order."""
+        self.network_cert(network)
+        return [self.sign_result(network, node, overwrite=overwrite) for node in nodes]
+
+
+class DockerBackend(SigningBackend):
+    """`nebula-cert` of the Nebula Docker image, see `io.sign_node`.
+
+    Args:
+        batch (bool): `sign_nodes` signs every node in one container run (`io.sign_nodes_batch`).
+        workers (int | None): `sign_nodes` signs up to `workers` nodes at once (`io.sign_nodes_parallel`).
+        warm (bool): Sign through the network `io.SigningWorker` container instead of a container per node.
+    """
+
+    def __init__(self, batch=False, workers=None, warm=False):
+        self.batch = batch
+        self.workers = workers
+        self.warm = warm
+
+    def network_cert(self, network, overwrite=False):
+        _io.network_cert(network, overwrite=overwrite)
+
+    def sign_node(self, network, node, overwrite=False):
+        if self.warm:
+            _io.sign_node(network, node, overwrite=overwrite, warm=True)
+        else:
+            _io.sign_node(network, node, overwrite=overwrite)
+
+    def qr_code(self, network, cert, qr):
+        _io.qr_code(network, cert, qr)
+
+    def sign_nodes(self, network, nodes, overwrite=False):
+        if self.batch:
+            return _io.sign_nodes_batch(network, nodes, overwrite=overwrite)
+        if self.workers is not None:
+            return list(
+                _io.sign_nodes_parallel(
+                    network, nodes, workers=self.workers, overwrite=overwrite, warm=self.warm
+                )
+            )
+        return super().sign_nodes(network, nodes, overwrite=overwrite)
+
+
+class SubprocessBackend(SigningBackend):
+    """Local `nebula-cert` binary, run with the same arguments as in the Docker image.
+
+    `sign_nodes` creates the CA first, then runs one `nebula-cert sign` per node on a process pool of `workers`
+    processes. Outputs follow the `io.ca_outputs` and `io.node_outputs` layout.
+
+    Args:
+        binary (str): Path or name on `PATH` of `nebula-cert` (default is "nebula-cert").
+        workers (int | None): Number of pool processes of `sign_nodes`, 1 signs in this process (default is
+            None, the number of CPUs).
+    """
+
+    def __init__(self, binary="nebula-cert", workers: Optional[int] = None):
+        self.binary = binary
+        self.workers = workers
+        self._ca_lock = threading.Lock()
+
+    def run(self, cmd):
+        """Run `nebula-cert` with the arguments of string `cmd`.
+
+        Raises:
+            ValueError: `nebula-cert` failed.
+        """
+        error = run_nebula_cert(self.binary, cmd)
+        if error is not None:
+            raise ValueError(error)
+
+    def network_cert(self, network, overwrite=False):
+        _io.make_temp_dir(network)
+        if overwrite:
+            _io.ca_outputs(network, rm_exist=True)
+        with self._ca_lock:
+            if _io.ca_outputs(network, exist="all"):
+                return
+            if _io.ca_outputs(network, exist="any"):
+                raise ValueError(f"Missing some of the following files: {_io.ca_outputs(network)}")
+            self.run(_io.ca_command(network))
+            if not _io.ca_outputs(network, exist="all"):
+                files = _io.ca_outputs(network)
+                raise ValueError(f"nebula-cert ca did not create all of the following files: {files}")
+
+    def sign_node(self, network, node, overwrite=False):
+        self.network_cert(network)
+        command = self._pending(network, node, overwrite)
+        if command is not None:
+            self.run(command)
+
+    def qr_code(self, network, cert, qr):
+        self.run(_io.qr_command(cert, qr))
+
+    def sign_nodes(self, network, nodes, overwrite=False):
+        self.network_cert(network)
+        results = {}
+        pending = {}
+        for node in nodes:
+            try:
+                command = self._pending(network, node, overwrite)
+            except ValueError as e:
+                results[node.name] = _io.SignResult(node.name, False, str(e))
+                continue
+            if command is None:
+                results[node.name] = _io.SignResult(node.name, True)
+            else:
+                pending[node.name] = command
+        if len(pending) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                errors = list(pool.map(run_nebula_cert, [self.binary] * len(pending), pending.values()))
+        else:
+            errors = [run_nebula_cert(self.binary, command) for command in pending.values()]
+        for name, error in zip(pending, errors):
+            results[name] = _io.SignResult(name, error is None, error)
+        return [results[node.name] for node in nodes]
+
+    @staticmethod
+    def _pending(network, node, overwrite):
+        """`nebula-cert sign` arguments of `node`, or None if its outputs exist.
+
+        Raises:
+            ValueError: Some of the node outputs exist but not all of them.
+        """
+        if overwrite:
+            _io.node_outputs(network, node, rm_exist=True)
+        if _io.node_outputs(network, node, exist="all"):
+            return None
+        if _io.node_outputs(network, node, exist="any"):
+            raise ValueError(f"Missing some of the following files: {_io.node_outputs(network, node)}")
+        return _io.sign_command(network, node)
+
+
+def run_nebula_cert(binary: str, cmd: str) -> Optional[str]:
+    """Run `nebula-cert` at `binary` with the arguments of string `cmd`, in a `SubprocessBackend` pool process.
+
+    Returns:
+        str | None: Error message if `nebula-cert` failed, else None.
+    """
+    try:
+        process = subprocess.run([binary] + shlex.split(cmd), capture_output=True, text=True)
+    except OSError as e:
+        return f"nebula-cert {cmd.split()[0]} failed: {e}"
+    if process.returncode != 0:
+        return f"nebula-cert {cmd.split()[0]} failed: {process.stderr.strip()}"
+    return None
+
+
+class InProcessBackend(SigningBackend):
+    """In-process certificates of `pki`, without Docker or `nebula-cert` (IPv4 networks only, no QR images)."""
+
+    def qr_code(self, network, cert, qr):
+        raise ValueError("QR code images need nebula-cert, use DockerBackend or SubprocessBackend")
+
+    def network_cert(self, network, overwrite=False):
+        _pki.network_cert(network, overwrite=overwrite)
+
+    def sign_node(self, network, node, overwrite=False):
+        _pki.sign_node(network, node, overwrite=overwrite)
+
+
+class RecordingBackend(SigningBackend):
+    """Backend that records its calls in `calls` and writes no files.
+
+    Args:
+        fail (Iterable[str]): Names of nodes whose signing fails (default is ()).
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+
+    def network_cert(self, network, overwrite=False):
+        self.calls.append(("network_cert", network.cert_authority))
+
+    def sign_node(self, network, node, overwrite=False):
+        self.calls.append(("sign_node", node.name))
+        if node.name in self.fail:
+            raise ValueError(f"Signing of node {node.name} failed")
+
+    def qr_code(self, network, cert, qr):
+        self.calls.append(("qr_code", cert))
+
+
+def default_backend(batch=False, workers=None) -> SigningBackend:
+    """Backend of networks without a `NebulaNetwork.backend`."""
+    return DockerBackend(batch=batch, workers=workers)
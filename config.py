@@ -35,9 +35,12 @@ Find the official and definitive Nebula documentation at [here](https://nebula.d
 
 from __future__ import annotations
 
+import copy
 import ipaddress
 import os
 import tarfile
+import weakref
+from functools import lru_cache
 from io import BytesIO
 from typing import Any, Dict, Iterable, List, Literal, Mapping, Optional, Union
 
@@ -48,12 +51,114 @@ from pydantic import (
     Field,
     computed_field,
     field_serializer,
+    field_validator,
     model_serializer,
 )
 from pydantic.networks import IPvAnyAddress, IPvAnyInterface, IPvAnyNetwork
 
 from . import base as _base
 
+_SHARED = weakref.WeakValueDictionary()
+"""Interned shared section instances by (frozen class, repr)."""
+
+
+@lru_cache(maxsize=None)
+def _frozen_class(cls):
+    """Frozen subclass of model class `cls`, with the same name and serialization."""
+
+    class Frozen(cls, frozen=True):
+        pass
+
+    Frozen.__name__ = Frozen.__qualname__ = cls.__name__
+    Frozen.__module__ = cls.__module__
+    Frozen._mutable_class = cls
+    return Frozen
+
+
+def _frozen(self, *args, **kwargs):
+    raise TypeError("Shared config sections are immutable, change a copy from `unshared` or `NebulaConfig.own`")
+
+
+class _FrozenList(list):
+    """List of a shared section, immutable like the section itself."""
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _frozen
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _frozen
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+
+class _FrozenDict(dict):
+    """Dict of a shared section, immutable like the section itself."""
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _frozen
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+def _freeze(value):
+    """`value` with its models shared and its lists and dicts (recursively) made immutable."""
+    if isinstance(value, BaseModel):
+        return shared(value)
+    if isinstance(value, list):
+        return _FrozenList(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return _FrozenDict({key: _freeze(item) for key, item in value.items()})
+    return value
+
+
+def _thaw(value):
+    """Mutable copy of a value made immutable by `_freeze`."""
+    if isinstance(value, BaseModel):
+        return unshared(value)
+    if isinstance(value, list):
+        return [_thaw(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _thaw(item) for key, item in value.items()}
+    return value
+
+
+def shared(model: BaseModel) -> BaseModel:
+    """Immutable instance equal to `model` that is shared with every other equal model passed to `shared`.
+
+    Config sections that are the same on many nodes (`Listen`, `Punchy`, `Tun`, ...) can then be stored once
+    instead of once per node. The instance, its nested models and its lists and dicts are frozen, use
+    `unshared` or `NebulaConfig.own` to get a mutable copy to change.
+
+    Args:
+        model (BaseModel): Config section.
+
+    Returns:
+        BaseModel: Frozen subclass instance of the class of `model`.
+    """
+    if is_shared(model):
+        return model
+    cls = _frozen_class(type(model))
+    key = (cls, repr(model))
+    instance = _SHARED.get(key)
+    if instance is None:
+        values = {name: _freeze(value) for name, value in model.model_copy(deep=True).__dict__.items()}
+        instance = cls.model_construct(_fields_set=set(model.model_fields_set), **values)
+        _SHARED[key] = instance
+    return instance
+
+
+def is_shared(model: BaseModel) -> bool:
+    """True if `model` is a frozen instance returned by `shared`."""
+    return "_mutable_class" in type(model).__dict__
+
+
+def unshared(model: BaseModel) -> BaseModel:
+    """Mutable copy of `model` (and of its nested shared models) if it is shared, otherwise `model` itself."""
+    if not is_shared(model):
+        return model
+    values = {name: _thaw(value) for name, value in model.__dict__.items()}
+    return type(model)._mutable_class.model_construct(
+        _fields_set=set(model.model_fields_set), **values
+    )
+
 
 class Pki(_base.SkipNoneField):
     """Nebula [PKI configuration](https://nebula.defined.net/docs/config/pki)"""
@@ -85,6 +190,14 @@ class NetworkIPRange(BaseModel):
     mask: _base.CIDRLiteral = Field(alias="cidr")
     allow: bool | None = Field(default=None)
 
+    @field_validator("mask")
+    @classmethod
+    def _check_mask(cls, mask, info):
+        ip = info.data.get("ip")
+        if ip is not None and mask > ip.max_prefixlen:
+            raise ValueError(f"cidr {mask} is too large for IPv{ip.version} address {ip}")
+        return mask
+
     @model_serializer
     def __str__(self) -> str:
         return f"{str(self.ip)}/{self.cidr}"
@@ -453,6 +566,37 @@ class NebulaConfig(_base.SkipNoneField):
     firewall: Firewall = Field(default=Firewall())
     _skip = ["logging", "stats", "preferred_ranges"]
 
+    @classmethod
+    def shared_defaults(cls) -> Dict[str, BaseModel]:
+        """Shared (see `shared`) instances of the default value of every section field of the config."""
+        return {
+            name: shared(field.default)
+            for name, field in cls.model_fields.items()
+            if isinstance(field.default, BaseModel)
+        }
+
+    def own(self, name: str) -> BaseModel:
+        """Section `name` of this config as an instance owned by this config alone.
+
+        Configs built by `NebulaNetwork` share frozen sections between nodes (see `shared`). The first call
+        replaces a shared section with a mutable copy (copy-on-write), so it can be changed for this node only.
+
+        ```python
+        node.config.own("listen").port = 4243
+        ```
+
+        Args:
+            name (str): Section field name, e.g. "listen" or "firewall".
+
+        Returns:
+            BaseModel: The mutable section.
+        """
+        section = getattr(self, name)
+        if isinstance(section, BaseModel) and is_shared(section):
+            section = unshared(section)
+            setattr(self, name, section)
+        return section
+
     # def model_dump(self) -> dict[str, str]:
     # out_dict = do_skip_none(self)
     # shm_dict = {}
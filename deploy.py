@@ -68,11 +68,7 @@ def save_compose(network, node):
     Yields:
         [TODO:description]
     """
-    if node is not None:
-        if type(node) is not str:
-            name = node.name
-    else:
-        name = node
+    name = node if node is None or type(node) is str else node.name
     nodes = network.get_nodes(name)
     for node in nodes:
         name = node.name
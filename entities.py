@@ -2,19 +2,35 @@
 
 from __future__ import annotations
 
+import asyncio
+import gc
+import hashlib
 import ipaddress
+import json
 import os
-from typing import Any, Dict, Iterable, List, Literal, Mapping, Optional, Union
+import socket
+from bisect import bisect_left, bisect_right
+from contextvars import ContextVar
+from functools import cached_property, lru_cache
+from typing import (Any, AsyncIterator, Dict, Iterable, List, Literal, Mapping,
+                    Optional, Union)
 
 import yaml
-from pydantic import (BaseModel, Field, computed_field, field_serializer,
+from pydantic import (BaseModel, ConfigDict, Field, PrivateAttr,
+                      computed_field, field_serializer, field_validator,
                       model_serializer)
 from pydantic.networks import IPvAnyAddress, IPvAnyInterface, IPvAnyNetwork
 
+from . import backends as _backends
 from . import base as _base
 from . import config as _config
 from . import deploy as _deploy
+from . import inventory as _inventory
 from . import io as _io
+from . import ipam as _ipam
+from . import pki as _pki
+from . import query as _query
+from . import table as _table
 
 
 class NebulaNode(BaseModel):
@@ -53,33 +69,82 @@ class NebulaNode(BaseModel):
     """Nebula node port (default is 4242)."""
     am_lighthouse: bool = False
     """Boolean speciyfing if the node is a lighthouse (`am_lighthouse=True`) or not (defaut is False)."""
+    am_relay: bool = False
+    """Boolean specifying if the node is a relay for other nodes (default is False)."""
     public: _config.RoutableIPPort | None = None
     """Public routable IP (and optionally port) for lighthouse nodes."""
     config: _config.NebulaConfig | None = None
     """`config.NebulaConfig` Pydantic model class that stores the required node configuration for the Nebula binary."""
     groups: List[str | _config.InOutboundItem] = []
     """In and outbound firewall groups."""
+    pool: str | None = None
+    """Name of the `NebulaNetwork.pools` sub-range to allocate the node IP from (default is None for the rest of the network)."""
 
-    def dump_config(self, output=None):
+    @field_validator("ip", mode="wrap")
+    @classmethod
+    def _fast_ip(cls, value, handler):
+        # `IPvAnyAddress` parses with `ipaddress.ip_address`, even address objects after formatting them, which
+        # dominates node validation time
+        if type(value) is str:
+            return _parse_ip(value)
+        if type(value) in (ipaddress.IPv4Address, ipaddress.IPv6Address):
+            return value
+        return handler(value)
+
+    def dump_config(self, output=None, config=None):
         """Method for serializing `self.config` to YAML.
 
         Args:
             output (str | None): Path to output config YAML file if not None. If None (default), function returns YAML contents as string.
+            config (config.NebulaConfig | None): Config to serialize instead of `self.config` (default is None).
 
         Returns:
             str | None
         """
-        assert self.config is not None
-        yamlstr = yaml.dump(self.config.model_dump())
+        config = self.config if config is None else config
+        assert config is not None
+        yamlstr = yaml.dump(config.model_dump())
         if output is None:
             return yamlstr
         with open(output, "wt") as f:
             f.write(yamlstr)
 
+    def group_names(self) -> List[str]:
+        """Names of the firewall groups in `self.groups`, whether given as strings or `config.InOutboundItem`s."""
+        names = []
+        for group in self.groups:
+            if type(group) is str:
+                names.append(group)
+                continue
+            if group.group is not None:
+                names.append(group.group)
+            if group.groups is not None:
+                names.extend(group.groups)
+        return names
+
+    def _record(self) -> Dict[str, Any]:
+        """JSON-serializable node fields for `NebulaNetwork.dump_inventory`, `config` is not included."""
+        record = {
+            "name": self.name,
+            "ip": None if self.ip is None else str(self.ip),
+            "port": self.port,
+            "am_lighthouse": self.am_lighthouse,
+            "am_relay": self.am_relay,
+            "public": None,
+            "groups": [
+                group if type(group) is str else _firewall_item_record(group)
+                for group in self.groups
+            ],
+            "pool": self.pool,
+        }
+        if self.public is not None:
+            record["public"] = {"ip": str(self.public.ip), "port": self.public.port}
+        return record
+
     def get_firewall_items_from_groups(self):
         for i, group in enumerate(self.groups):
             if type(group) is str:
-                self.groups[i] = _config.InOutboundItem(group=group)
+                self.groups[i] = _group_rule(group)
         return _config.Firewall(outbound=self.groups, inbound=self.groups)
 
 
@@ -114,6 +179,98 @@ class NebulaNode(BaseModel):
 #         c.images.build(path="./", dockerfile=dpath, tag=tag, rm=True)
 
 
+@lru_cache(maxsize=4096)
+def _group_rule(group):
+    """Shared `config.InOutboundItem` allowing any traffic of firewall group `group`."""
+    return _config.shared(_config.InOutboundItem(group=group))
+
+
+def _parse_ip(text):
+    """IP address object of `text`, parsed with `socket.inet_pton` which is several times faster than
+    `ipaddress.ip_address` for well-formed addresses."""
+    try:
+        if ":" in text:
+            return ipaddress.IPv6Address(int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big"))
+        return ipaddress.IPv4Address(int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big"))
+    except OSError:
+        return ipaddress.ip_address(text)
+
+
+def _firewall_item_record(item):
+    """JSON-serializable fields of a `config.InOutboundItem` that are not None."""
+    record = {k: v for k, v in item if v is not None}
+    if record.get("host", "any") != "any":
+        record["host"] = str(record["host"])
+    if "local_cidr" in record:
+        cidr = record["local_cidr"]
+        record["local_cidr"] = {"ip": str(cidr.ip), "cidr": cidr.mask, "allow": cidr.allow}
+    return record
+
+
+def _canonical_json(document) -> str:
+    """Canonical JSON encoding of `document`, the encoding of the inventory files and their checksums."""
+    return json.dumps(document, sort_keys=True, separators=(",", ":"))
+
+
+def inventory_checksum(inventory: Mapping[str, Any]) -> str:
+    """SHA-256 hex digest of the canonical JSON encoding of an inventory written by
+    `NebulaNetwork.dump_inventory`."""
+    return hashlib.sha256(_canonical_json(inventory).encode()).hexdigest()
+
+
+def _file_checksum(text: str) -> str | None:
+    """`inventory_checksum` of the network inventory in inventory file contents `text`, hashed without decoding
+    the file. None unless the file is still in the canonical JSON written by `NebulaNetwork.dump_inventory`."""
+    head, tail = '{"checksum":"', '","network":'
+    start = len(head) + 64 + len(tail)
+    if not text.startswith(head) or text[start - len(tail) : start] != tail or not text.endswith("}"):
+        return None
+    return hashlib.sha256(text[start:-1].encode()).hexdigest()
+
+
+def _construct_nodes(records: Iterable[Mapping[str, Any]]) -> List[NebulaNode]:
+    """`NebulaNode`s of the node records of a trusted inventory, built without validation.
+
+    Does the work of `NebulaNode.model_construct`, which costs more per node than validating the node, in one
+    loop with its lookups bound to locals.
+    """
+    construct, cls, parse_ip = _construct, NebulaNode, _parse_ip
+    nodes = []
+    for record in records:
+        ip, public, groups = record["ip"], record["public"], record["groups"]
+        if public is not None:
+            public = construct(_config.RoutableIPPort, {"ip": parse_ip(public["ip"]), "port": public["port"]})
+        fields = {
+            "name": record["name"],
+            "ip": None if ip is None else parse_ip(ip),
+            "port": record["port"],
+            "am_lighthouse": record["am_lighthouse"],
+            "am_relay": record["am_relay"],
+            "public": public,
+            "config": None,
+            "groups": [g if type(g) is str else _config.InOutboundItem.model_validate(g) for g in groups],
+            "pool": record["pool"],
+        }
+        nodes.append(construct(cls, fields))
+    return nodes
+
+
+def _construct(cls, fields):
+    """Instance of pydantic model `cls` with every field value in `fields`, set without validation."""
+    model = object.__new__(cls)
+    object.__setattr__(model, "__dict__", fields)
+    object.__setattr__(model, "__pydantic_fields_set__", set(fields))
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+
+_table_nodes = ContextVar("table_nodes", default=None)
+"""`table.TableNodes` of the network that `NebulaNetwork.from_table` is constructing."""
+_trusted = ContextVar("trusted", default=False)
+"""True while `NebulaNetwork.from_trusted` constructs a network, to skip the node consistency checks."""
+
+
 class _NebulaTempFiles(BaseModel):
     """[TODO:description]
 
@@ -121,19 +278,27 @@ class _NebulaTempFiles(BaseModel):
         network: [TODO:attribute]
     """
 
-    network: NebulaNetwork
+    network: NebulaNetwork = Field(exclude=True, repr=False)
 
     @computed_field
-    @property
+    @cached_property
     def dir(self) -> str:
         """Network outputs directory named after `self.network.cert_authority`"""
         return os.path.abspath(f"{self.network.cert_authority}")
 
     @computed_field
-    @property
+    @cached_property
     def ca_cert_prefix(self) -> str:
         """Network CA output filename prefix (under `{self.dir}/`) based on CA name and network IP range"""
-        return f"{self.dir}/{self.network.cert_authority}_{self.network.ip}_{self.network.cidr}"
+        # IPv6 colons are swapped out to keep the filename portable
+        ip = str(self.network.ip).replace(":", "-")
+        return f"{self.dir}/{self.network.cert_authority}_{ip}_{self.network.cidr}"
+
+    @computed_field
+    @cached_property
+    def ledger(self) -> str:
+        """Default node IP assignment ledger path (under `{self.dir}/`) based on CA name and network IP range"""
+        return f"{self.ca_cert_prefix}_ledger.yaml"
 
     def node_cert_prefix(self, node):
         """[TODO:description]
@@ -177,79 +342,568 @@ class _NebulaTempFiles(BaseModel):
         return f"{self.dir}/{compose}"
 
 
+def _pool_errors(network, pools):
+    """Descriptions of `pools` that are not subnets of `network` or that overlap each other."""
+    errors = []
+    subnets = sorted(pools.items(), key=lambda p: p[1].network_address)
+    for i, (name, subnet) in enumerate(subnets):
+        if subnet.version != network.version or not subnet.subnet_of(network):
+            errors.append(f"pool {name} {subnet} is not a subnet of {network}")
+        elif i > 0 and subnets[i - 1][1].overlaps(subnet):
+            errors.append(f"pool {name} {subnet} overlaps pool {subnets[i - 1][0]}")
+    return errors
+
+
+class RenumberPlan(BaseModel):
+    """Renumbering of a `NebulaNetwork` into a new address range, computed by `NebulaNetwork.plan_renumber`.
+
+    Nodes whose IP is already a host of the new range (and of their pool) keep it, every other node moves to the
+    lowest free address of its pool (or its hashed address). Apply the plan with `NebulaNetwork.apply_renumber`.
+    """
+
+    ip: IPvAnyAddress
+    """New network IP."""
+    cidr: _base.CIDRLiteral
+    """New network CIDR."""
+    pools: Dict[str, IPvAnyNetwork] = {}
+    """Sub-ranges of the new network."""
+    moves: Dict[str, IPvAnyAddress] = {}
+    """New IP of every node that moves, by node name."""
+    new_ca: bool = False
+    """True if the new range is not within the current network, so the CA and every node certificate must be
+    re-issued."""
+    resign: List[str] = []
+    """Names of the nodes whose certificates must be signed again: the moved nodes, or every node if the CA is
+    re-issued or the CIDR changes (node certificates hold the network prefix length)."""
+    reconfigure: List[str] = []
+    """Names of the nodes whose configs must be regenerated, the re-signed nodes plus every node that maps a
+    moved lighthouse in its `static_host_map`."""
+
+
+_NETWORK_CACHE_KEYS = ("nodes", "ip", "cidr", "cert_authority")
+"""`NebulaNetwork` fields that invalidate its memoized derived properties when assigned."""
+
+
 class NebulaNetwork(BaseModel):
     cert_authority: str
     ip: IPvAnyAddress
     nodes: List[NebulaNode] = []
     cidr: _base.CIDRLiteral = 24
+    ledger: bool | str = False
+    """Persist node IP assignments so they never move between runs. Either a path to a YAML ledger file or True
+    to use `temp.ledger` (default is False, assignments follow the order of `nodes`)."""
+    pools: Dict[str, IPvAnyNetwork] = {}
+    """Named sub-ranges of `network` (e.g. a /22 per site or a block per group) that nodes with a matching
+    `NebulaNode.pool` are allocated from. Addresses of the sub-ranges are never handed to other nodes."""
+    allocation: Literal["sequential", "hashed"] = "sequential"
+    """How missing node IPs are chosen. "sequential" (default) takes the lowest free addresses in node order,
+    "hashed" derives each address from a hash of the node name (probing upwards on collision) so that separate
+    processes given the same nodes compute the same addresses regardless of node order."""
+    qr: bool = False
+    """Also write a QR code image (`.png`) of the CA and of every node certificate when signing (default is False).
+    Certificates signed before are not signed again for their image, render images on demand from existing
+    certificates with `qr_code`."""
+    backend: Optional[_backends.SigningBackend] = Field(default=None, exclude=True, repr=False)
+    """`backends.SigningBackend` that creates the CA and node certificates (default is None for
+    `backends.DockerBackend`). Not included in dumps."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    _pools: _ipam.PoolSet | None = PrivateAttr(default=None)
+    _ledger: _ipam.AddressLedger | None = PrivateAttr(default=None)
+    _by_name: Dict[str, NebulaNode] = PrivateAttr(default_factory=dict)
+    _by_ip: Dict[Any, NebulaNode] = PrivateAttr(default_factory=dict)
+    _by_group: Dict[str, Dict[str, NebulaNode]] = PrivateAttr(default_factory=dict)
+    _by_role: Dict[str, Dict[str, NebulaNode]] = PrivateAttr(default_factory=dict)
+    _order: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _next_order: int = PrivateAttr(default=0)
+    _held: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _cache: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in _NETWORK_CACHE_KEYS:
+            # Derived properties (`network`, `lighthouses`, `temp`) are recomputed on next access
+            self._cache.clear()
+            if name == "nodes":
+                self.reindex()
+
+    @field_validator("cidr")
+    @classmethod
+    def _check_cidr(cls, cidr, info):
+        ip = info.data.get("ip")
+        if ip is not None and cidr > ip.max_prefixlen:
+            raise ValueError(f"cidr {cidr} is too large for IPv{ip.version} network {ip}")
+        return cidr
+
+    @field_serializer("nodes", mode="wrap")
+    def _dump_nodes(self, nodes, handler):
+        # Table networks are dumped like node lists, without materializing their nodes for good
+        if isinstance(nodes, _table.TableNodes):
+            nodes = nodes.snapshot()
+        return handler(nodes)
 
     def model_post_init(self, context):
         # Strip/sanitize cert_authority str
         self.cert_authority = self.cert_authority.replace(" ", "")
-        # Calculate any missing IP addresses
-        h = set(ipaddress.ip_network(self.network).hosts())
+        table_nodes = _table_nodes.get()
+        if table_nodes is not None:
+            _table_nodes.set(None)
+            self.nodes = table_nodes
+        if not _trusted.get():
+            self._check_nodes()
+        # Calculate any missing IP addresses from the free intervals left in the network
+        self._pools = _ipam.PoolSet(self.network, self.pools, taken=self._taken())
+        if self.ledger:
+            self._load_ledger()
+        if self._table_backed():
+            self.nodes.allocate(self._pools, hashed=self.allocation == "hashed")
+        else:
+            self._allocate([n for n in self.nodes if n.ip is None])
+        if self._ledger is not None:
+            for name, ip in self._assignments():
+                self._ledger.set(name, ip)
+            self._ledger.save()
+        self.reindex()
+
+    def _table_backed(self) -> bool:
+        """True if `nodes` is the `table.TableNodes` of a `from_table` network."""
+        return isinstance(self.nodes, _table.TableNodes)
+
+    def _taken(self) -> List:
+        """IP addresses of the nodes that have one."""
+        if self._table_backed():
+            return self.nodes.addresses()
+        return [n.ip for n in self.nodes if n.ip is not None]
+
+    def _assignments(self) -> Iterable:
+        """Name and IP address of every node that has an IP."""
+        if self._table_backed():
+            return self.nodes.assignments()
+        return ((n.name, n.ip) for n in self.nodes if n.ip is not None)
+
+    def reindex(self):
+        """Rebuild the node lookup indexes by name, IP, group and role.
+
+        Indexes are kept current by `add_nodes`, `remove_node` and `apply_renumber`, call this after changing
+        `nodes` or node fields in place.
+        """
+        if self._table_backed():
+            # The indexes are views of the table columns, only the changes of materialized nodes are written
+            self.nodes.sync()
+            index = self.nodes.index()
+            self._by_name = index["name"]
+            self._by_ip = index["ip"]
+            self._by_group = index["group"]
+            self._by_role = index["role"]
+            self._order = index["order"]
+            self._lighthouses_changed()
+            self._cache.pop("ip_order", None)
+            return
+        # Same as `_index` on every node, with the indexes bound to locals as private attribute access is slow
+        by_name, by_ip, by_group, order = {}, {}, {}, {}
+        lighthouses, relays = {}, {}
         for node in self.nodes:
-            _ip = node.ip
-            if _ip is not None:
-                h = h - set([_ip])
-        hosts = sorted(list(h))
-        for i, node in enumerate(filter(lambda x: x.ip is None, self.nodes)):
-            node.ip = hosts[i]
+            name = node.name
+            by_name[name] = node
+            by_ip[node.ip] = node
+            order[name] = len(order)
+            for group in node.group_names():
+                by_group.setdefault(group, {})[name] = node
+            if node.am_lighthouse:
+                lighthouses[name] = node
+            if node.am_relay:
+                relays[name] = node
+        self._by_name = by_name
+        self._by_ip = by_ip
+        self._by_group = by_group
+        self._by_role = {"lighthouse": lighthouses, "relay": relays}
+        self._order = order
+        self._next_order = len(order)
+        self._lighthouses_changed()
+        self._cache.pop("ip_order", None)
+
+    def _index(self, node):
+        if self._table_backed():
+            if node.am_lighthouse:
+                self._lighthouses_changed()
+            return
+        self._by_name[node.name] = node
+        self._by_ip[node.ip] = node
+        # Removed nodes leave gaps, positions only ever increase so that they follow the order of `nodes`
+        self._order[node.name] = self._next_order
+        self._next_order += 1
+        self._cache.pop("ip_order", None)
+        for group in node.group_names():
+            self._by_group.setdefault(group, {})[node.name] = node
+        if node.am_lighthouse:
+            self._by_role["lighthouse"][node.name] = node
+            self._lighthouses_changed()
+        if node.am_relay:
+            self._by_role["relay"][node.name] = node
+
+    def _unindex(self, node):
+        if self._table_backed():
+            self._cache.get("configs", {}).pop(node.name, None)
+            if node.am_lighthouse:
+                self._lighthouses_changed()
+            return
+        self._by_name.pop(node.name, None)
+        self._order.pop(node.name, None)
+        self._cache.pop("ip_order", None)
+        if self._by_ip.get(node.ip) is node:
+            del self._by_ip[node.ip]
+        for group in node.group_names():
+            members = self._by_group.get(group, {})
+            members.pop(node.name, None)
+            if not members:
+                self._by_group.pop(group, None)
+        for members in self._by_role.values():
+            members.pop(node.name, None)
+        self._cache.get("configs", {}).pop(node.name, None)
+        if node.am_lighthouse:
+            self._lighthouses_changed()
+
+    def _lighthouses_changed(self):
+        """Drop the memoized lighthouse list and everything derived from it (the node config sections)."""
+        self._cache.pop("lighthouses", None)
+        self._cache.pop("config_sections", None)
+        self._cache.pop("configs", None)
+
+    def _check_nodes(self):
+        """Fail on repeated node names, shared node IPs and node IPs that are not hosts of `self.network`."""
+        if self._table_backed():
+            errors = self.nodes.check(self.network, self.pools) + _pool_errors(self.network, self.pools)
+            if errors:
+                raise ValueError("Invalid nodes: " + "; ".join(errors))
+            return
+        errors = []
+        names = {}
+        for node in self.nodes:
+            names[node.name] = names.get(node.name, 0) + 1
+        for name, count in names.items():
+            if count > 1:
+                errors.append(f"name {name} is used by {count} nodes")
+        collisions, out_of_range = _ipam.find_conflicts(
+            self.network, [n.ip for n in self.nodes]
+        )
+        for group in collisions:
+            shared = ", ".join(self.nodes[i].name for i in group)
+            errors.append(f"IP {self.nodes[group[0]].ip} is shared by nodes {shared}")
+        for i in out_of_range:
+            node = self.nodes[i]
+            errors.append(f"IP {node.ip} of node {node.name} is not a host of {self.network}")
+        errors += _pool_errors(self.network, self.pools)
+        for node in self.nodes:
+            if node.pool is None:
+                continue
+            if node.pool not in self.pools:
+                errors.append(f"pool {node.pool} of node {node.name} does not exist")
+            elif node.ip is not None and node.ip not in self.pools[node.pool]:
+                errors.append(f"IP {node.ip} of node {node.name} is outside of pool {node.pool}")
+        if errors:
+            raise ValueError("Invalid nodes: " + "; ".join(errors))
+
+    def _allocate(self, nodes):
+        """Assign free addresses of their pools to `nodes`, one bulk allocation per pool."""
+        by_pool = {}
+        for node in nodes:
+            by_pool.setdefault(node.pool, []).append(node)
+        allocated = []
+        try:
+            for name, group in by_pool.items():
+                addrs = self._pools.allocate(
+                    name, [n.name for n in group], hashed=self.allocation == "hashed"
+                )
+                allocated.append((name, group))
+                for node, addr in zip(group, addrs):
+                    node.ip = addr
+        except ValueError:
+            for name, group in allocated:
+                for node in group:
+                    self._pools.get(name).release(node.ip)
+                    node.ip = None
+            raise
+
+    def _load_ledger(self):
+        """Restore recorded IPs of nodes without one and reserve the IPs of recorded nodes that are absent."""
+        if self.ledger is True:
+            _io.make_temp_dir(self)
+            path = self.temp.ledger
+        else:
+            path = self.ledger
+        self._ledger = _ipam.AddressLedger(path)
+        if self._table_backed():
+            unassigned = self.nodes.unassigned()
+            table = self.nodes.table
+        else:
+            unassigned = dict((n.name, n) for n in self.nodes if n.ip is None)
+        explicit = set(name for name, _ in self._assignments())
+        for name, addr in self._ledger:
+            if name in explicit:
+                continue
+            addr = ipaddress.ip_address(addr)
+            if addr.version != self.network.version:
+                continue
+            if name in unassigned:
+                # Recorded IPs that were taken by an explicit node, fell out of the network or out of the
+                # node's pool are reassigned
+                node = unassigned[name]
+                if self._table_backed():
+                    pool = int(table.pool[node])
+                    if self._pools.get(None if pool < 0 else table.pools[pool]).reserve(addr):
+                        self.nodes.set_address(node, addr)
+                elif self._pools.get(node.pool).reserve(addr):
+                    node.ip = addr
+            else:
+                self._pools.pool_of(addr).reserve(addr)
 
     @computed_field
     @property
     def network(self) -> IPvAnyNetwork:
-        """ """
-        return IPvAnyNetwork(str(self.ip) + f"/{self.cidr}")
+        """Network range from `ip` and `cidr`."""
+        if "network" not in self._cache:
+            self._cache["network"] = IPvAnyNetwork(str(self.ip) + f"/{self.cidr}")
+        return self._cache["network"]
 
     @computed_field
     @property
     def lighthouses(self) -> List[NebulaNode]:
-        """ """
-        return list(filter(lambda n: n.am_lighthouse, self.nodes))
+        """Lighthouse nodes of the network."""
+        if "lighthouses" not in self._cache:
+            self._cache["lighthouses"] = list(self._by_role["lighthouse"].values())
+        return self._cache["lighthouses"]
 
     @computed_field
     @property
     def temp(self) -> _NebulaTempFiles:
-        """ """
-        return _NebulaTempFiles(network=self)
+        """Output file paths of the network, resolved against the working directory on first access."""
+        if "temp" not in self._cache:
+            self._cache["temp"] = _NebulaTempFiles(network=self)
+        return self._cache["temp"]
 
     def create_network_cert(
         self,
     ):
         """[TODO:description]"""
-        _io.network_cert(self)
+        self._signer().network_cert(self)
 
     def create_node_cert(
         self,
+        configs: bool = True,
+        batch: bool = False,
+        workers: int | None = None,
+        raise_on_error: bool = True,
     ):
-        """[TODO:description]"""
-        for node in self.nodes:
-            _io.sign_node(
-                self,
-                node=node,
-            )
-            ca_cert, ca_key, ca_qr = _io.ca_outputs(self)
-            node_cert, node_key, node_qr = _io.node_outputs(self, node)
-            pki = _config.Pki(
-                ca=ca_cert,
-                cert=node_cert,
-                key=node_key,
-            )
-            lh = _config.Lighthouse(am_lighthouse=node.am_lighthouse)
-            fw = node.get_firewall_items_from_groups()
-            if not node.am_lighthouse:
-                shm = _config.StaticHostMap(
-                    contents=dict([(n.ip, [n.public]) for n in self.lighthouses])
-                )
-            else:
-                shm = _config.StaticHostMap()
-            node.config = _config.NebulaConfig(
-                pki=pki,
-                static_host_map=shm,
-                lighthouse=lh,
-                firewall=fw,
-            )
+        """Sign the certificate of every node with the network `backend`, creating the network CA first if needed.
+
+        Args:
+            configs (bool): Also build every `NebulaNode.config` (default is True). With False only the
+                certificates are created, configs are then derived on demand by `node_config` and
+                `save_node_configs`.
+            batch (bool): Sign every node in one container run with `io.sign_nodes_batch` instead of one
+                container per node (default is False). Only applies without a `backend`.
+            workers (int | None): Sign up to `workers` nodes concurrently with `io.sign_nodes_parallel`
+                (default is None to sign one node at a time). Only applies without a `backend`.
+            raise_on_error (bool): Raise when any node failed to sign (default is True). With False failures
+                are only reported in the returned results.
+
+        Raises:
+            ValueError: `batch` or `workers` is given together with a `backend`, configure the backend instead,
+                or a node failed to sign and `raise_on_error` is True.
+
+        Returns:
+            list[io.SignResult]: Result of every node, in order. Configs are only built for the nodes that
+                were signed.
+        """
+        if self.backend is not None and (batch or workers is not None):
+            raise ValueError("batch and workers only apply to the default backend, configure the backend instead")
+        results = self._signer(batch=batch, workers=workers).sign_nodes(self, self.nodes)
+        if configs:
+            for node, result in zip(self.nodes, results):
+                if result.ok:
+                    node.config = self._build_node_config(node)
+        failed = [result for result in results if not result.ok]
+        if failed and raise_on_error:
+            errors = "; ".join(f"{result.name}: {result.error}" for result in failed)
+            raise ValueError(f"Cannot sign the certificate of {len(failed)} node(s): {errors}")
+        return results
+
+    def qr_code(self, node: NebulaNode | str | None = None, overwrite: bool = False) -> str:
+        """QR code image of an existing certificate, rendered with the network `backend` unless it exists.
+
+        Args:
+            node (NebulaNode | str | None): Node whose certificate is rendered (default is None for the CA).
+            overwrite (bool): Render the image again if it exists (default is False).
+
+        Raises:
+            ValueError: The certificate does not exist or rendering failed.
+
+        Returns:
+            str: Path to the QR code image.
+        """
+        prefix = self.temp.ca_cert_prefix if node is None else self.temp.node_cert_prefix(node)
+        cert, qr = f"{prefix}.crt", f"{prefix}.png"
+        if not os.path.exists(cert):
+            raise ValueError(f"Certificate {cert} does not exist")
+        if overwrite or not os.path.exists(qr):
+            self._signer().qr_code(self, cert, qr)
+        return qr
+
+    def _signer(self, batch=False, workers=None) -> _backends.SigningBackend:
+        """`backend`, or the default Docker backend."""
+        if self.backend is not None:
+            return self.backend
+        return _backends.default_backend(batch=batch, workers=workers)
+
+    def node_config(self, node: NebulaNode | str, cache: bool = True) -> _config.NebulaConfig:
+        """Nebula config of `node`, derived from the network state (PKI paths, lighthouses and the node firewall
+        groups) unless `node.config` is set.
+
+        Derived configs are kept until `release_node_configs` or a change of the network lighthouses. Call
+        `release_node_configs` after changing node fields in place.
+
+        Args:
+            node (NebulaNode | str): Node or node name.
+            cache (bool): Keep the derived config for later calls (default is True).
+
+        Returns:
+            config.NebulaConfig
+        """
+        if type(node) is str:
+            node = self.get_node(node)
+        if node.config is not None:
+            return node.config
+        configs = self._cache.setdefault("configs", {})
+        config = configs.get(node.name)
+        if config is None:
+            config = self._build_node_config(node)
+            if cache:
+                configs[node.name] = config
+        return config
+
+    def release_node_configs(self, node: NebulaNode | str | None = None):
+        """Drop the derived config of `node` (default is None for every node) kept by `node_config`."""
+        if node is None:
+            self._cache.pop("configs", None)
+            return
+        name = node if type(node) is str else node.name
+        self._cache.get("configs", {}).pop(name, None)
+
+    def _config_sections(self) -> Dict[str, Any]:
+        """Shared config sections of the network (see `config.shared`), computed once per set of lighthouses."""
+        if "config_sections" not in self._cache:
+            lighthouse_map = dict([(n.ip, [n.public]) for n in self.lighthouses])
+            self._cache["config_sections"] = {
+                "ca": _io.ca_outputs(self)[0],
+                "defaults": _config.NebulaConfig.shared_defaults(),
+                "static_host_map": _config.shared(_config.StaticHostMap(contents=lighthouse_map)),
+                "lighthouse": {f: _config.shared(_config.Lighthouse(am_lighthouse=f)) for f in (False, True)},
+                "relay": {f: _config.shared(_config.Relay(am_relay=f)) for f in (False, True)},
+                "listen": {},
+            }
+        return self._cache["config_sections"]
+
+    def _build_node_config(self, node: NebulaNode) -> _config.NebulaConfig:
+        # Sections that are equal across nodes are stored once and shared by every config (see `config.shared`)
+        sections = self._config_sections()
+        defaults = sections["defaults"]
+        node_cert, node_key = _io.node_outputs(self, node)[:2]
+        pki = _config.Pki(
+            ca=sections["ca"],
+            cert=node_cert,
+            key=node_key,
+        )
+        listen = sections["listen"]
+        if node.port not in listen:
+            listen[node.port] = _config.shared(_config.Listen(port=node.port))
+        shm = defaults["static_host_map"] if node.am_lighthouse else sections["static_host_map"]
+        return _config.NebulaConfig(
+            **{
+                **defaults,
+                "pki": pki,
+                "static_host_map": shm,
+                "lighthouse": sections["lighthouse"][node.am_lighthouse],
+                "relay": sections["relay"][node.am_relay],
+                "listen": listen[node.port],
+                "firewall": _config.shared(node.get_firewall_items_from_groups()),
+            }
+        )
+
+    def _select(self, node=None) -> List[NebulaNode]:
+        """`node` as a list, or every node if None."""
+        return self.get_nodes(node if node is None or type(node) is str else node.name)
+
+    async def acreate_network_cert(self):
+        """Asyncio variant of `create_network_cert`, running the CA container off the event loop."""
+        await asyncio.to_thread(self._signer().network_cert, self)
+
+    async def acreate_node_cert(
+        self, configs: bool = True, concurrency: int = _io.DEFAULT_CONCURRENCY
+    ) -> AsyncIterator[_io.SignResult]:
+        """Asyncio variant of `create_node_cert`, signing up to `concurrency` nodes at once off the event loop.
+
+        ```python
+        async for result in net.acreate_node_cert():
+            print(result.name, result.ok)
+        ```
+
+        Args:
+            configs (bool): Also build `NebulaNode.config` of every signed node (default is True).
+            concurrency (int): Maximum number of concurrent signing containers (default is
+                `io.DEFAULT_CONCURRENCY`).
+
+        Yields:
+            io.SignResult: Result of every node, in completion order.
+        """
+        await asyncio.to_thread(_io.make_temp_dir, self)
+        await self.acreate_network_cert()
+        backend = self._signer()
+        signed = _io.as_completed_in_threads(
+            lambda node: (node, backend.sign_result(self, node)), list(self.nodes), concurrency
+        )
+        async for node, result in signed:
+            if configs and result.ok:
+                node.config = self._build_node_config(node)
+            yield result
+
+    async def asave_node_configs(
+        self, node=None, concurrency: int = _io.DEFAULT_CONCURRENCY
+    ) -> AsyncIterator[str]:
+        """Asyncio variant of `save_node_configs`, writing up to `concurrency` configs at once off the event loop.
+
+        Args:
+            node (NebulaNode | str | None): Node to save the config of (default is None for every node).
+            concurrency (int): Maximum number of concurrent writes (default is `io.DEFAULT_CONCURRENCY`).
+
+        Yields:
+            str: Path of every written config, in completion order.
+        """
+
+        def save(node):
+            list(_io.save_config(self, node))
+            return self.temp.node_config(node.name)
+
+        async for path in _io.as_completed_in_threads(save, self._select(node), concurrency):
+            yield path
+
+    async def asave_node_composes(
+        self, node=None, concurrency: int = _io.DEFAULT_CONCURRENCY
+    ) -> AsyncIterator[str]:
+        """Asyncio variant of `save_node_composes`, writing up to `concurrency` files at once off the event loop.
+
+        Args:
+            node (NebulaNode | str | None): Node to save the compose file of (default is None for every node).
+            concurrency (int): Maximum number of concurrent writes (default is `io.DEFAULT_CONCURRENCY`).
+
+        Yields:
+            str: Path of every written compose file, in completion order.
+        """
+
+        def save(node):
+            list(_deploy.save_compose(self, node))
+            return self.temp.node_compose(node)
+
+        async for path in _io.as_completed_in_threads(save, self._select(node), concurrency):
+            yield path
 
     def save_node_configs(self, node=None):
         """[TODO:description]
@@ -273,16 +927,473 @@ class NebulaNetwork(BaseModel):
         """
         return [compose for compose in _deploy.save_compose(self, node)]
 
-    def get_nodes(self, filter=None):
-        """[TODO:description]
+    def get_node(self, name: str) -> NebulaNode:
+        """Node named `name`.
+
+        Raises:
+            KeyError: No node with that name in the network.
+        """
+        return self._by_name[name]
+
+    def get_node_by_ip(self, ip) -> NebulaNode:
+        """Node with overlay IP `ip`.
+
+        Raises:
+            KeyError: No node with that IP in the network.
+        """
+        return self._by_ip[ipaddress.ip_address(ip)]
+
+    def _names_in_range(self, network) -> List[str]:
+        """Names of the nodes whose IP is within `network`, from a sorted IP index built on demand."""
+        if self._table_backed():
+            names = self.nodes.table.names
+            return [names[r] for r in self.nodes.select(subnet=network).tolist()]
+        if "ip_order" not in self._cache:
+            ordered = sorted(
+                (ip.version, int(ip), n.name) for ip, n in self._by_ip.items()
+            )
+            self._cache["ip_order"] = (
+                [(v, i) for v, i, _ in ordered],
+                [name for _, _, name in ordered],
+            )
+        keys, names = self._cache["ip_order"]
+        low = bisect_left(keys, (network.version, int(network.network_address)))
+        high = bisect_right(keys, (network.version, int(network.broadcast_address)))
+        return names[low:high]
+
+    def get_nodes(
+        self,
+        name: str | None = None,
+        group: str | None = None,
+        role: Literal["lighthouse", "relay"] | None = None,
+        where: str | _query.Selector | None = None,
+    ) -> List[NebulaNode]:
+        """Nodes matching all given criteria, looked up from the network indexes.
 
         Args:
-            filter ([TODO:parameter]): [TODO:description]
+            name (str | None): Node name (default is None for any name).
+            group (str | None): Firewall group the nodes belong to (default is None for any group).
+            role (str | None): "lighthouse" or "relay" (default is None for any role).
+            where (str | query.Selector | None): Selector or query string, see `maloja.query` (default is None).
 
         Returns:
-            [TODO:return]
+            list[NebulaNode]: Nodes in the order of `nodes`.
         """
-        if filter is None:
+        if where is not None:
+            selected = _query.compile(where).names(self)
+            if name is not None:
+                selected &= {name}
+            if group is not None:
+                selected &= set(self._by_group.get(group, ()))
+            if role is not None:
+                selected &= set(self._by_role[role])
+            return [self._by_name[n] for n in sorted(selected, key=self._order.get)]
+        if self._table_backed() and name is None and (group is not None or role is not None):
+            flags = {"lighthouse": _table.LIGHTHOUSE, "relay": _table.RELAY}[role] if role else None
+            return [self.nodes.node(r) for r in self.nodes.select(group=group, flags=flags).tolist()]
+        if name is not None:
+            candidates = [self._by_name[name]] if name in self._by_name else []
+        elif group is not None:
+            candidates = list(self._by_group.get(group, {}).values())
+        elif role is not None:
+            candidates = list(self._by_role[role].values())
+        else:
             return self.nodes
+        if group is not None:
+            members = self._by_group.get(group, {})
+            candidates = [n for n in candidates if n.name in members]
+        if role is not None:
+            members = self._by_role[role]
+            candidates = [n for n in candidates if n.name in members]
+        return candidates
+
+    def add_node(self, node: NebulaNode | Mapping[str, Any]) -> NebulaNode:
+        """Add a single node to the network, see `add_nodes`.
+
+        Args:
+            node (NebulaNode | Mapping): Node, or node fields to validate into a `NebulaNode`.
+
+        Returns:
+            NebulaNode: The added node with its IP address assigned.
+        """
+        return self.add_nodes([node])[0]
+
+    def add_nodes(
+        self, nodes: Iterable[NebulaNode | Mapping[str, Any]]
+    ) -> List[NebulaNode]:
+        """Add nodes to the network without re-initializing it.
+
+        Nodes without an IP address get their ledger address if one is recorded and free, otherwise the lowest
+        free address of the network. Explicit IP addresses are reserved. Nothing is added if any node fails.
+
+        Args:
+            nodes (Iterable[NebulaNode | Mapping]): Nodes, or node fields to validate into `NebulaNode`s.
+
+        Raises:
+            ValueError: A node name already exists or an explicit IP address is taken or outside of the network.
+
+        Returns:
+            list[NebulaNode]: The added nodes with their IP addresses assigned.
+        """
+        nodes = [
+            n if isinstance(n, NebulaNode) else NebulaNode.model_validate(n)
+            for n in nodes
+        ]
+        names = set()
+        for node in nodes:
+            if node.name in self._by_name or node.name in names:
+                raise ValueError(f"Node {node.name} already exists in the network")
+            names.add(node.name)
+        reserved = []
+        claimed = {}
+        try:
+            for node in filter(lambda n: n.ip is not None, nodes):
+                pool = self._pools.get(node.pool)
+                if self._claim_held(node, pool, claimed):
+                    continue
+                if not pool.reserve(node.ip):
+                    raise ValueError(
+                        f"IP {node.ip} of node {node.name} is in use or outside of {pool.network}"
+                    )
+                reserved.append((pool, node.ip))
+            unassigned = []
+            for node in filter(lambda n: n.ip is None, nodes):
+                pool = self._pools.get(node.pool)
+                if self._claim_held(node, pool, claimed):
+                    continue
+                addr = None
+                if self._ledger is not None:
+                    addr = self._ledger.get(node.name)
+                if addr is not None and pool.reserve(addr):
+                    node.ip = ipaddress.ip_address(addr)
+                    reserved.append((pool, node.ip))
+                else:
+                    unassigned.append(node)
+            self._allocate(unassigned)
+        except ValueError:
+            for pool, addr in reserved:
+                pool.release(addr)
+            self._held.update(claimed)
+            raise
+        self.nodes.extend(nodes)
+        for node in nodes:
+            self._index(node)
+            if self._ledger is not None:
+                self._ledger.set(node.name, node.ip)
+        if self._ledger is not None:
+            self._ledger.save()
+        return nodes
+
+    def _claim_held(self, node, pool, claimed):
+        """Give `node` the address still held for its name by `remove_node(release=False)`, if it fits.
+
+        The address is already reserved in `pool`, so it is taken over instead of reserved again. Nodes with an
+        explicit IP only claim the held address if it is that IP.
+        """
+        addr = self._held.get(node.name)
+        if addr is None or self._pools.pool_of(addr) is not pool:
+            return False
+        if node.ip is not None and node.ip != addr:
+            return False
+        node.ip = addr
+        claimed[node.name] = self._held.pop(node.name)
+        return True
+
+    def remove_node(self, node: NebulaNode | str, release: bool = True) -> NebulaNode:
+        """Remove a node from the network without re-initializing it.
+
+        Args:
+            node (NebulaNode | str): Node or node name to remove.
+            release (bool): Return the node IP to the free pool and drop it from the ledger (default is True).
+                If False, the address stays reserved and is given back to the next node added with the same
+                name (and no other IP).
+
+        Raises:
+            KeyError: No node with that name in the network.
+
+        Returns:
+            NebulaNode: The removed node.
+        """
+        name = node if type(node) is str else node.name
+        node = self._by_name[name]
+        self._unindex(node)
+        if self._table_backed():
+            self.nodes.discard(self.nodes.row_of(name))
+        else:
+            for i, n in enumerate(self.nodes):
+                if n is node:
+                    del self.nodes[i]
+                    break
+        if release:
+            self._pools.pool_of(node.ip).release(node.ip)
+            if self._ledger is not None:
+                self._ledger.pop(name)
+                self._ledger.save()
+        else:
+            self._held[name] = node.ip
+        return node
+
+    def ranges(self, nodes: Iterable[NebulaNode] | None = None) -> List[IPvAnyNetwork]:
+        """Fewest prefixes covering `nodes`, using the whole pool range for pooled nodes.
+
+        Useful to keep `unsafe_routes`, `preferred_ranges` and firewall `local_cidr` entries short when nodes are
+        grouped into `pools`.
+
+        Args:
+            nodes (Iterable[NebulaNode] | None): Nodes to cover (default is None for all nodes).
+
+        Returns:
+            list[IPvAnyNetwork]
+        """
+        if nodes is None:
+            nodes = self.nodes
+        prefixes = set()
+        for node in nodes:
+            if node.pool is not None:
+                prefixes.add(self.pools[node.pool])
+            else:
+                prefixes.add(ipaddress.ip_network(node.ip))
+        return list(ipaddress.collapse_addresses(prefixes))
+
+    def plan_renumber(
+        self,
+        ip,
+        cidr: int | None = None,
+        pools: Mapping[str, Any] | None = None,
+    ) -> RenumberPlan:
+        """Compute the renumbering into `ip/cidr` that moves the fewest nodes.
+
+        Args:
+            ip (str | IPvAnyAddress): New network IP.
+            cidr (int | None): New network CIDR (default is None to keep `self.cidr`).
+            pools (Mapping | None): Sub-ranges of the new network (default is None to keep `self.pools`).
+
+        Raises:
+            ValueError: The pools do not fit the new network or it is too small for the nodes.
+
+        Returns:
+            RenumberPlan
+        """
+        cidr = self.cidr if cidr is None else cidr
+        target = ipaddress.ip_network(f"{ip}/{cidr}")
+        pools = dict(
+            (k, ipaddress.ip_network(v))
+            for k, v in (self.pools if pools is None else pools).items()
+        )
+        errors = _pool_errors(target, pools)
+        errors += [
+            f"pool {n.pool} of node {n.name} does not exist"
+            for n in self.nodes
+            if n.pool is not None and n.pool not in pools
+        ]
+        if errors:
+            raise ValueError("Invalid renumbering: " + "; ".join(errors))
+        plan = _ipam.PoolSet(target, pools)
+        movers = []
+        for node in self.nodes:
+            # Nodes that are already hosts of the new range and of their pool stay put
+            if node.ip.version == target.version and plan.name_of(node.ip) == node.pool:
+                if plan.get(node.pool).reserve(node.ip):
+                    continue
+            movers.append(node)
+        moves = {}
+        by_pool = {}
+        for node in movers:
+            by_pool.setdefault(node.pool, []).append(node.name)
+        for name, names in by_pool.items():
+            addrs = plan.allocate(name, names, hashed=self.allocation == "hashed")
+            moves.update(zip(names, addrs))
+        new_ca = target.version != self.network.version or not target.subnet_of(
+            self.network
+        )
+        # Node certificates carry `ip/cidr`, so a new prefix length invalidates all of them
+        if new_ca or target.prefixlen != self.network.prefixlen:
+            resign = [n.name for n in self.nodes]
         else:
-            return list(filter(lambda n: filter in n.name, self.nodes))
+            resign = [n.name for n in self.nodes if n.name in moves]
+        reconfigure = set(resign)
+        if any(n.am_lighthouse and n.name in moves for n in self.nodes):
+            # Every other node maps the lighthouse IPs in its static_host_map
+            reconfigure.update(n.name for n in self.nodes if not n.am_lighthouse)
+        reconfigure = [n.name for n in self.nodes if n.name in reconfigure]
+        return RenumberPlan(
+            ip=target.network_address,
+            cidr=cidr,
+            pools=pools,
+            moves=moves,
+            new_ca=new_ca,
+            resign=resign,
+            reconfigure=reconfigure,
+        )
+
+    def apply_renumber(self, plan: RenumberPlan, remove_stale: bool = True):
+        """Move the network and its nodes to the range of `plan`.
+
+        If the CA stays valid (`plan.new_ca` is False) its output files are renamed to the new network prefix
+        so that only the nodes in `plan.resign` need new certificates.
+
+        Args:
+            plan (RenumberPlan): Plan from `plan_renumber`.
+            remove_stale (bool): Delete the certificate outputs of the nodes in `plan.resign` so the next
+                `create_node_cert` signs them again (default is True).
+        """
+        old_ca = _io.ca_outputs(self)
+        self.ip = plan.ip
+        self.cidr = plan.cidr
+        self.pools = dict(plan.pools)
+        for name, addr in plan.moves.items():
+            self._by_name[name].ip = addr
+        self.reindex()
+        if not plan.new_ca:
+            for old, new in zip(old_ca, _io.ca_outputs(self)):
+                if old != new and os.path.exists(old):
+                    os.replace(old, new)
+        if remove_stale:
+            for name in plan.resign:
+                _io.node_outputs(self, name, rm_exist=True)
+        self._pools = _ipam.PoolSet(self.network, self.pools, taken=self._taken())
+        # Addresses held for removed nodes belong to the old range
+        self._held.clear()
+        if self._ledger is not None:
+            if self.ledger is True:
+                _io.make_temp_dir(self)
+                self._ledger.path = self.temp.ledger
+                self._ledger.changed = True
+            for name, ip in self._assignments():
+                self._ledger.set(name, ip)
+            self._ledger.save()
+
+    @classmethod
+    def from_table(
+        cls, table: _table.NodeTable, rows: Iterable[int] | None = None, **kwargs
+    ) -> NebulaNetwork:
+        """Network whose `nodes` are rows of a columnar `table.NodeTable`.
+
+        The nodes are a `table.TableNodes` sequence that materializes `NebulaNode`s on first access. Validation,
+        IP allocation and lookups by name, IP, group, role or query run on the table columns, so only the nodes
+        that are accessed (e.g. signed or configured) are ever created. Allocated IPs are written to `table`.
+
+        Args:
+            table (table.NodeTable): Node table.
+            rows (Iterable[int] | None): Rows to include, in node order (default is None for every row).
+            **kwargs: Other `NebulaNetwork` fields such as `cert_authority`, `ip` and `cidr`.
+
+        Raises:
+            ValueError: `kwargs` has `nodes`, or the nodes are invalid like in any other network.
+
+        Returns:
+            NebulaNetwork
+        """
+        if "nodes" in kwargs:
+            raise ValueError("Nodes of a table network are the rows of its table")
+        token = _table_nodes.set(_table.TableNodes(table, rows))
+        try:
+            return cls(**kwargs)
+        finally:
+            _table_nodes.reset(token)
+
+    def inventory(self) -> Dict[str, Any]:
+        """JSON-serializable network fields and node records, as written by `dump_inventory`.
+
+        Node configs are derived data and are not included.
+        """
+        return {
+            "cert_authority": self.cert_authority,
+            "ip": str(self.ip),
+            "cidr": self.cidr,
+            "ledger": self.ledger,
+            "pools": {name: str(subnet) for name, subnet in self.pools.items()},
+            "allocation": self.allocation,
+            "qr": self.qr,
+            "nodes": [node._record() for node in self.nodes],
+        }
+
+    def dump_inventory(self, output: str) -> str:
+        """Save the network inventory to a JSON file along with its checksum, reload it with `load_inventory`.
+
+        Args:
+            output (str): Path to output JSON file.
+
+        Returns:
+            str: `inventory_checksum` of the saved inventory. Keep it apart from the file and pass it to
+            `load_inventory` to load the file as trusted.
+        """
+        inventory = self.inventory()
+        checksum = inventory_checksum(inventory)
+        document = {"checksum": checksum, "network": inventory}
+        with open(output, "wt") as f:
+            f.write(_canonical_json(document))
+        return checksum
+
+    @classmethod
+    def load_inventory(cls, path: str, checksum: str | None = None) -> NebulaNetwork:
+        """Load a network saved by `dump_inventory`.
+
+        If `checksum` matches the inventory, the network is built from it without validation by `from_trusted`,
+        otherwise it is fully validated. The checksum stored in the file is not trusted, as anyone who edits the
+        file can update it.
+
+        Args:
+            path (str): Path to the inventory JSON file.
+            checksum (str | None): Checksum returned by `dump_inventory` when the file was saved (default is
+                None to fully validate the inventory).
+
+        Returns:
+            NebulaNetwork
+        """
+        with open(path, "rt") as f:
+            text = f.read()
+        document = json.loads(text)
+        if checksum is not None and _file_checksum(text) == checksum:
+            # The file is byte for byte the one `dump_inventory` wrote, no need to encode it again to check it
+            return cls._construct_trusted(document["network"])
+        return cls.from_trusted(document["network"], checksum)
+
+    @classmethod
+    def from_trusted(cls, inventory: Mapping[str, Any], checksum: str | None) -> NebulaNetwork:
+        """Network of an `inventory` dict, built without validating its fields or checking its nodes for
+        duplicate names and IPs.
+
+        Validation is only skipped if `checksum` is the `inventory_checksum` of `inventory`, i.e. the inventory
+        is unchanged since the caller got `checksum` from `inventory_checksum` or `dump_inventory`. Otherwise
+        the inventory is validated like any untrusted input. Missing node IPs are still allocated and the
+        ledger is still used.
+
+        Args:
+            inventory (Mapping[str, Any]): Network inventory with JSON types.
+            checksum (str | None): Known-good checksum of `inventory`, from a source other than `inventory`.
+
+        Returns:
+            NebulaNetwork
+        """
+        if checksum is None or inventory_checksum(inventory) != checksum:
+            return cls.model_validate(inventory)
+        return cls._construct_trusted(inventory)
+
+    @classmethod
+    def _construct_trusted(cls, inventory: Mapping[str, Any]) -> NebulaNetwork:
+        """`model_construct` of a trusted inventory, with its nodes built by `_construct_nodes`."""
+        # Building many objects at once triggers the cyclic garbage collector over and over for nothing
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        token = _trusted.set(True)
+        try:
+            nodes = _construct_nodes(inventory["nodes"])
+            return cls.model_construct(
+                cert_authority=inventory["cert_authority"],
+                ip=_parse_ip(inventory["ip"]),
+                nodes=nodes,
+                cidr=inventory["cidr"],
+                ledger=inventory["ledger"],
+                pools={name: ipaddress.ip_network(subnet) for name, subnet in inventory["pools"].items()},
+                allocation=inventory["allocation"],
+                qr=inventory["qr"],
+            )
+        finally:
+            _trusted.reset(token)
+            if gc_enabled:
+                gc.enable()
+
+    def to_table(self) -> _table.NodeTable:
+        """Columnar `table.NodeTable` copy of the network nodes."""
+        return _table.NodeTable.from_nodes(self.nodes, version=self.network.version)
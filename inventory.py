@@ -0,0 +1,249 @@
+"""Streaming node importers for CSV, JSON Lines and Ansible inventories.
+
+Readers yield one mapping of `NebulaNode` fields per host, and `import_nodes` validates them in batches and adds
+them to a `NebulaNetwork`, so only one batch of records is held in memory on top of the network itself.
+
+```python
+net = NebulaNetwork(cert_authority="My CA", ip="10.100.0.0", cidr=16)
+import_nodes(net, read_csv("hosts.csv"))
+import_nodes(net, read_ansible("inventory.ini"), batch_size=5000)
+```
+
+Record fields are the `NebulaNode` field names, optionally prefixed with `nebula_` (e.g. `nebula_ip` in Ansible
+host vars). `public` is given as `ip:port` (`[ip]:port` for IPv6, the port defaults to 4242) and `groups` as a
+list, or as a string of names separated by `;` in CSV and INI files.
+"""
+
+import csv
+import json
+import shlex
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping
+
+import yaml
+from pydantic import TypeAdapter
+
+from . import ipam as _ipam
+
+_NODE_FIELDS = ("name", "ip", "port", "am_lighthouse", "am_relay", "public", "groups", "pool")
+"""`NebulaNode` fields that records can set."""
+_ANSIBLE_SKIP_GROUPS = ("all", "ungrouped")
+"""Ansible implicit groups that are not added to node firewall groups."""
+
+
+@lru_cache(maxsize=None)
+def node_adapter() -> TypeAdapter:
+    """Shared `TypeAdapter(List[NebulaNode])` used to validate batches of records in one call."""
+    from .entities import NebulaNode
+
+    return TypeAdapter(List[NebulaNode])
+
+
+def node_record(name: str, fields: Mapping[str, Any]) -> Dict[str, Any]:
+    """`NebulaNode` fields of host `name` from raw inventory `fields`, other fields are ignored.
+
+    Args:
+        name (str): Node name, used unless `fields` has a `name`.
+        fields (Mapping[str, Any]): Host fields or variables.
+
+    Returns:
+        dict
+    """
+    record = {"name": name}
+    for key, value in fields.items():
+        if key.startswith("nebula_"):
+            key = key[len("nebula_") :]
+        if key not in _NODE_FIELDS or value is None or value == "":
+            continue
+        if key == "public" and type(value) is str:
+            value = parse_public(value)
+        elif key == "groups" and type(value) is str:
+            value = [g.strip() for g in value.split(";") if g.strip()]
+        record[key] = value
+    return record
+
+
+def parse_public(value: str) -> Dict[str, Any]:
+    """`config.RoutableIPPort` fields of an `ip`, `ip:port` or `[ip]:port` string (default port is 4242)."""
+    if value.startswith("["):
+        ip, _, port = value[1:].partition("]")
+        port = port.lstrip(":")
+    elif value.count(":") == 1:
+        ip, port = value.split(":")
+    else:
+        ip, port = value, ""
+    return {"ip": ip, "port": int(port) if port else 4242}
+
+
+def read_csv(path: str, **kwargs) -> Iterator[Dict[str, Any]]:
+    """Stream node records from a CSV file with a header row of `NebulaNode` field names.
+
+    Args:
+        path (str): Path to the CSV file.
+        **kwargs: Format parameters for `csv.DictReader`, such as `delimiter`.
+
+    Yields:
+        dict: Node record.
+    """
+    with open(path, "rt", newline="") as f:
+        for row in csv.DictReader(f, **kwargs):
+            yield node_record(row.get("name"), row)
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream node records from a JSON Lines file with one object of `NebulaNode` fields per line.
+
+    Args:
+        path (str): Path to the JSON Lines file.
+
+    Yields:
+        dict: Node record.
+    """
+    with open(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                fields = json.loads(line)
+                yield node_record(fields.get("name"), fields)
+
+
+def read_ansible(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream node records from an Ansible inventory in INI or YAML (`.yml`/`.yaml`) format.
+
+    Every host becomes a node named after its inventory hostname. The groups it belongs to, directly or through
+    `children`, become its firewall groups, and node fields are read from the group and host variables (host
+    variables win over group variables, which win over the variables of `all`).
+
+    Args:
+        path (str): Path to the inventory file.
+
+    Yields:
+        dict: Node record.
+    """
+    if path.endswith((".yml", ".yaml")):
+        hosts, groups = _parse_ansible_yaml(path)
+    else:
+        hosts, groups = _parse_ansible_ini(path)
+    parents = {}
+    for group, spec in groups.items():
+        for child in spec["children"]:
+            parents.setdefault(child, []).append(group)
+    memberships = {}
+    for group, spec in groups.items():
+        for host in spec["hosts"]:
+            memberships.setdefault(host, []).append(group)
+    for host, host_vars in hosts.items():
+        ancestors = _ancestors(memberships.get(host, []), parents)
+        # Every host is in `all`, whether or not its groups are declared as children of `all`
+        fields = dict(groups.get("all", {}).get("vars", {}))
+        for group in reversed(ancestors):
+            fields.update(groups.get(group, {}).get("vars", {}))
+        fields.update(host_vars)
+        fields.setdefault(
+            "groups", [g for g in ancestors if g not in _ANSIBLE_SKIP_GROUPS]
+        )
+        yield node_record(host, fields)
+
+
+def _ancestors(groups, parents):
+    """`groups` followed by their parent groups, nearest first and without repeats."""
+    seen = {}
+    queue = list(groups)
+    while queue:
+        group = queue.pop(0)
+        if group not in seen:
+            seen[group] = None
+            queue.extend(parents.get(group, []))
+    return list(seen)
+
+
+def _new_group():
+    return {"hosts": [], "children": [], "vars": {}}
+
+
+def _parse_ansible_ini(path):
+    """Hosts with their variables and groups with their hosts, children and variables of an INI inventory."""
+    hosts = {}
+    groups = {}
+    section, kind = "ungrouped", "hosts"
+    with open(path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section, _, kind = line[1:-1].partition(":")
+                kind = kind or "hosts"
+                groups.setdefault(section, _new_group())
+                continue
+            group = groups.setdefault(section, _new_group())
+            if kind == "children":
+                group["children"].append(line)
+                continue
+            if kind == "vars":
+                key, _, value = line.partition("=")
+                group["vars"][key.strip()] = value.strip().strip("'\"")
+                continue
+            tokens = shlex.split(line, comments=True)
+            host = tokens[0]
+            host_vars = hosts.setdefault(host, {})
+            for token in tokens[1:]:
+                key, _, value = token.partition("=")
+                host_vars[key] = value
+            group["hosts"].append(host)
+    return hosts, groups
+
+
+def _parse_ansible_yaml(path):
+    """Hosts with their variables and groups with their hosts, children and variables of a YAML inventory."""
+    with open(path, "rt") as f:
+        document = yaml.load(f, Loader=_ipam._YamlLoader) or {}
+    hosts = {}
+    groups = {}
+
+    def visit(name, spec):
+        spec = spec or {}
+        group = groups.setdefault(name, _new_group())
+        group["vars"].update(spec.get("vars") or {})
+        for host, host_vars in (spec.get("hosts") or {}).items():
+            hosts.setdefault(host, {}).update(host_vars or {})
+            group["hosts"].append(host)
+        for child, child_spec in (spec.get("children") or {}).items():
+            group["children"].append(child)
+            visit(child, child_spec)
+
+    for name, spec in document.items():
+        visit(name, spec)
+    return hosts, groups
+
+
+def batched(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Lists of up to `size` consecutive items of `records`."""
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+def import_nodes(network, records: Iterable[Mapping[str, Any]], batch_size: int = 1000) -> int:
+    """Validate node records in batches and add them to `network` with `NebulaNetwork.add_nodes`.
+
+    Each batch is validated with one `node_adapter` call and added atomically, so a failing batch adds none of
+    its nodes while the batches before it stay in the network.
+
+    Args:
+        network (NebulaNetwork): Network to add the nodes to.
+        records (Iterable[Mapping[str, Any]]): Node records, e.g. from `read_csv`, `read_jsonl` or
+            `read_ansible`.
+        batch_size (int): Number of records validated and added at a time (default is 1000).
+
+    Raises:
+        ValueError: A record is invalid, a node name already exists or an IP address is taken.
+
+    Returns:
+        int: Number of nodes added.
+    """
+    adapter = node_adapter()
+    count = 0
+    for batch in batched(records, batch_size):
+        count += len(network.add_nodes(adapter.validate_python(batch)))
+    return count
@@ -1,9 +1,16 @@
 """Methods for wrangling Network and Node files on disk between the local filesystem and Nebula Docker container."""
 
+import asyncio
+import atexit
 import os
+import shlex
 import tarfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Any, Dict, Iterable, List, Literal, Mapping, Optional, Union
+from typing import Any, Dict, Iterable, List, Literal, Mapping, NamedTuple, Optional, Union
 
 import docker
 import yaml
@@ -16,9 +23,32 @@ NEBULA_IMAGE = "nebulaoss/nebula"
 """Nebula Docker image base"""
 nebula_image = f"{NEBULA_IMAGE}:{NEBULA_IMAGE_VERSION}"
 """Full Nebula Docker image string"""
+SHELL_IMAGE = "busybox:latest"
+"""Image with a POSIX shell that runs batched `nebula-cert` commands, the Nebula image itself has no shell"""
 
 
-dclient = docker.DockerClient()
+dclient = None
+"""Docker client of the Docker backed functions, created by `docker_client` on first use"""
+
+
+def docker_client():
+    """Shared Docker client, connecting to the daemon on first use rather than at import."""
+    global dclient
+    if dclient is None:
+        dclient = docker.DockerClient()
+    return dclient
+
+
+_ca_lock = threading.Lock()
+
+DEFAULT_CONCURRENCY = 8
+"""Default number of concurrent Docker and filesystem jobs of the asyncio API"""
+
+
+def container_name(*parts):
+    """Unique container name made of `parts`, so that concurrent runs for the same node or network never
+    collide."""
+    return "_".join(parts + (uuid.uuid4().hex[:12], "docker"))
 
 
 def make_temp_dir(network=None, dir=None):
@@ -40,6 +70,34 @@ def make_temp_dir(network=None, dir=None):
     return dir
 
 
+def output_extensions(network):
+    """Extensions of the certificate files of `network`, with the QR code image only if `NebulaNetwork.qr`."""
+    return ("crt", "key", "png") if network.qr else ("crt", "key")
+
+
+def _remove_outputs(prefix):
+    """Delete the certificate files at `prefix`, including a QR code image whether it is configured or not."""
+    for ext in ("crt", "key", "png"):
+        if os.path.exists(f"{prefix}.{ext}"):
+            os.unlink(f"{prefix}.{ext}")
+
+
+def _outputs_exist(fs, exist, assert_exist):
+    """`fs`, or whether its certificate and key exist if `exist`. A missing QR code image never makes a
+    certificate incomplete, it is rendered on demand by `NebulaNetwork.qr_code`."""
+    certs = fs[:2]
+    if assert_exist:
+        for f in certs:
+            assert os.path.exists(f)
+    if not exist:
+        return fs
+    else:
+        if exist == "all":
+            return all([os.path.exists(f) for f in certs])
+        elif exist == "any":
+            return any([os.path.exists(f) for f in certs])
+
+
 def node_outputs(
     network,
     node,
@@ -60,20 +118,12 @@ def node_outputs(
         [TODO:return]
     """
     fs = []
-    for ext in ("crt", "key", "png"):
-        fs.append(f"{network.temp.node_cert_prefix(node)}.{ext}")
-        if assert_exist:
-            assert os.path.exists(fs[-1])
-        if rm_exist:
-            if os.path.exists(fs[-1]):
-                os.unlink(fs[-1])
-    if not exist:
-        return fs
-    else:
-        if exist == "all":
-            return all([os.path.exists(f) for f in fs])
-        elif exist == "any":
-            return any([os.path.exists(f) for f in fs])
+    prefix = network.temp.node_cert_prefix(node)
+    for ext in output_extensions(network):
+        fs.append(f"{prefix}.{ext}")
+    if rm_exist:
+        _remove_outputs(prefix)
+    return _outputs_exist(fs, exist, assert_exist)
 
 
 def ca_outputs(
@@ -94,36 +144,48 @@ def ca_outputs(
         [TODO:return]
     """
     fs = []
-    for ext in ("crt", "key", "png"):
-        fs.append(f"{network.temp.ca_cert_prefix}.{ext}")
-        if assert_exist:
-            assert os.path.exists(fs[-1])
-        if rm_exist:
-            if os.path.exists(fs[-1]):
-                os.unlink(fs[-1])
-    if not exist:
-        return fs
-    else:
-        if exist == "all":
-            return all([os.path.exists(f) for f in fs])
-        elif exist == "any":
-            return any([os.path.exists(f) for f in fs])
+    prefix = network.temp.ca_cert_prefix
+    for ext in output_extensions(network):
+        fs.append(f"{prefix}.{ext}")
+    if rm_exist:
+        _remove_outputs(prefix)
+    return _outputs_exist(fs, exist, assert_exist)
+
+
+class SignResult(NamedTuple):
+    """Outcome of signing the certificate of node `name`, `error` is None on success."""
+
+    name: str
+    ok: bool
+    error: str | None = None
 
 
 def sign_nodes(
     network,
     overwrite=False,
+    batch=False,
+    workers=None,
 ):
     """[TODO:description]
 
     Args:
         network ([TODO:parameter]): [TODO:description]
         overwrite ([TODO:parameter]): [TODO:description]
+        batch (bool): Sign every node in one container run with `sign_nodes_batch` and yield its
+            `SignResult`s (default is False).
+        workers (int | None): Sign nodes concurrently with `sign_nodes_parallel` on this many threads and yield
+            its `SignResult`s (default is None to sign one node at a time).
 
     Yields:
         [TODO:description]
     """
     nodes = network.get_nodes()
+    if batch:
+        yield from sign_nodes_batch(network, nodes, overwrite=overwrite)
+        return
+    if workers is not None:
+        yield from sign_nodes_parallel(network, nodes, workers=workers, overwrite=overwrite)
+        return
     for node in nodes:
         yield sign_node(
             network,
@@ -132,6 +194,70 @@ def sign_nodes(
         )
 
 
+def sign_nodes_parallel(network, nodes=None, workers=None, overwrite=False, warm=False):
+    """Sign the certificates of `nodes` (default is None for every node) with a pool of `workers` threads.
+
+    Each thread runs `sign_node`, so up to `workers` signing containers (or `SigningWorker` execs if `warm`)
+    run at once. The network CA is created before the pool starts.
+
+    Args:
+        network (NebulaNetwork): Network of the nodes.
+        nodes (Iterable[NebulaNode] | None): Nodes to sign.
+        workers (int | None): Maximum number of concurrent signings (default is None for the
+            `concurrent.futures.ThreadPoolExecutor` default).
+        overwrite (bool): Remove existing node outputs and sign again (default is False).
+        warm (bool): Sign with the network `SigningWorker` (default is False).
+
+    Yields:
+        SignResult: Result of every node, in the order of `nodes`.
+    """
+    nodes = network.get_nodes() if nodes is None else list(nodes)
+    make_temp_dir(network)
+    network_cert(network=network)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            lambda node: sign_node_result(network, node, overwrite=overwrite, warm=warm), nodes
+        )
+
+
+def sign_node_result(network, node, overwrite=False, warm=False) -> SignResult:
+    """`sign_node` reporting its outcome as a `SignResult` instead of raising."""
+    try:
+        sign_node(network, node, overwrite=overwrite, warm=warm)
+    except Exception as e:
+        return SignResult(node.name, False, str(e))
+    return SignResult(node.name, True)
+
+
+async def as_completed_in_threads(function, items, concurrency=DEFAULT_CONCURRENCY):
+    """Run blocking `function` on every item of `items` in threads, without blocking the event loop.
+
+    At most `concurrency` calls run at once. Results are yielded in completion order, and calls that have not
+    started yet are cancelled if the consumer stops early.
+
+    Args:
+        function (Callable): Blocking function of one item, e.g. `sign_node_result`.
+        items (Iterable): Items to call `function` on.
+        concurrency (int): Maximum number of concurrent calls (default is `DEFAULT_CONCURRENCY`).
+
+    Yields:
+        Return values of `function`.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await asyncio.to_thread(function, item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 def get_working_dir(network):
     return f"{os.path.abspath(os.curdir)}"
 
@@ -140,6 +266,7 @@ def sign_node(
     network,
     node,
     overwrite=False,
+    warm=False,
 ):
     """[TODO:description]
 
@@ -147,28 +274,32 @@ def sign_node(
         network ([TODO:parameter]): [TODO:description]
         node ([TODO:parameter]): [TODO:description]
         overwrite ([TODO:parameter]): [TODO:description]
+        warm (bool): Sign with the network `SigningWorker` container instead of starting a container
+            (default is False).
 
     Raises:
         ValueError: [TODO:throw]
     """
+    if warm:
+        result = signing_worker(network).sign(node, overwrite=overwrite)
+        if not result.ok:
+            raise ValueError(f"Cannot sign node {node.name}: {result.error}")
+        return
     make_temp_dir(network)
     network_cert(network=network)
     if overwrite:
         node_outputs(network, node, rm_exist=True)
     # else:
     # assert not node_outputs(network, node, exist="any")
-    ca_files_prefix = network.temp.ca_cert_prefix
-    node_cert, node_key, node_qr = node_outputs(network, node)
-    cmd = f"sign -name {node.name} -ip {str(node.ip)}/{network.cidr} -ca-crt {ca_files_prefix}.crt -ca-key {ca_files_prefix}.key -out-crt {node_cert} -out-key {node_key} -out-qr {node_qr}"
-    cname = f"{node.name}_sign_cert_docker"
+    cmd = sign_command(network, node)
+    cname = container_name(node.name, "sign_cert")
     workingdir = get_working_dir(network)
     if not node_outputs(network, node, exist="all"):
         if node_outputs(network, node, exist="any"):
-            raise ValueError(
-                f"Missing some of the following files: {node_cert}, {node_key}, and {node_qr}"
-            )
+            files = ", ".join(node_outputs(network, node))
+            raise ValueError(f"Missing some of the following files: {files}")
         try:
-            cert_container = dclient.containers.run(
+            cert_container = docker_client().containers.run(
                 name=cname,
                 image=nebula_image,
                 command=cmd,
@@ -183,6 +314,298 @@ def sign_node(
             raise me
 
 
+def sign_command(network, node):
+    """`nebula-cert` arguments that sign the certificate of `node` with the network CA, shell quoted."""
+    ca_files_prefix = network.temp.ca_cert_prefix
+    node_cert, node_key = node_outputs(network, node)[:2]
+    # IPv6 overlays need the v2 certificate `-networks` flag of nebula-cert
+    ip_flag = "-ip" if network.ip.version == 4 else "-networks"
+    q = shlex.quote
+    cmd = f"sign -name {q(node.name)} {ip_flag} {str(node.ip)}/{network.cidr} -ca-crt {q(ca_files_prefix + '.crt')} -ca-key {q(ca_files_prefix + '.key')} -out-crt {q(node_cert)} -out-key {q(node_key)}"
+    if network.qr:
+        cmd += f" -out-qr {q(network.temp.node_cert_prefix(node) + '.png')}"
+    return cmd
+
+
+def ca_command(network):
+    """`nebula-cert` arguments that create the CA of `network`, shell quoted."""
+    ca_out = network.temp.ca_cert_prefix
+    ips_flag = "-ips" if network.ip.version == 4 else "-networks"
+    q = shlex.quote
+    cmd = f"ca -name {q(network.cert_authority)} {ips_flag} {network.network} -out-key {q(ca_out + '.key')} -out-crt {q(ca_out + '.crt')}"
+    if network.qr:
+        cmd += f" -out-qr {q(ca_out + '.png')}"
+    return cmd
+
+
+def qr_command(cert, qr):
+    """`nebula-cert` arguments that render the existing certificate `cert` as the QR code image `qr`, shell quoted."""
+    return f"print -path {shlex.quote(cert)} -out-qr {shlex.quote(qr)}"
+
+
+def qr_code(network, cert, qr):
+    """Render the certificate `cert` of `network` as the QR code image `qr` with `nebula-cert print`."""
+    workingdir = get_working_dir(network)
+    docker_client().containers.run(
+        name=container_name("network", network.cert_authority, "qr_code"),
+        image=nebula_image,
+        command=qr_command(cert, qr),
+        entrypoint="/nebula-cert",
+        remove=True,
+        detach=False,
+        working_dir=workingdir,
+        volumes=[f"{workingdir}:{workingdir}"],
+    )
+
+
+def nebula_cert_binary(network):
+    """Path of a copy of the `nebula-cert` binary of `nebula_image` in the network outputs directory.
+
+    The binary is statically linked, so it also runs in `SHELL_IMAGE`. It is copied out of the image once and
+    reused afterwards. The copy is named after the image ID, so an updated image is copied again and the
+    copies of older images are removed.
+    """
+    make_temp_dir(network)
+    image = docker_client().images.get(nebula_image)
+    name = f"nebula-cert-{image.id.split(':')[-1][:12]}"
+    path = os.path.join(network.temp.dir, name)
+    if not os.path.exists(path):
+        container = docker_client().containers.create(image=image.id)
+        try:
+            stream, _ = container.get_archive("/nebula-cert")
+            with tarfile.open(fileobj=BytesIO(b"".join(stream))) as tar:
+                data = tar.extractfile("nebula-cert").read()
+        finally:
+            container.remove()
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.chmod(f"{path}.tmp", 0o755)
+        os.replace(f"{path}.tmp", path)
+        for f in os.listdir(network.temp.dir):
+            if f.startswith("nebula-cert-") and f != name and not f.endswith(".tmp"):
+                os.remove(os.path.join(network.temp.dir, f))
+    return path
+
+
+def sign_nodes_batch(network, nodes=None, overwrite=False) -> List[SignResult]:
+    """Sign the certificates of `nodes` (default is None for every node) in a single container run.
+
+    `sign_node` starts one `nebulaoss/nebula` container per node. Here a shell script runs `nebula-cert sign` for
+    every node inside one `SHELL_IMAGE` container instead, so the container start-up is paid once per batch.
+    Nodes whose outputs all exist already are reported as signed without signing them again.
+
+    Args:
+        network (NebulaNetwork): Network of the nodes.
+        nodes (Iterable[NebulaNode] | None): Nodes to sign.
+        overwrite (bool): Remove existing node outputs and sign again (default is False).
+
+    Returns:
+        list[SignResult]: One result per node, in the order of `nodes`.
+    """
+    nodes = network.get_nodes() if nodes is None else list(nodes)
+    make_temp_dir(network)
+    network_cert(network=network)
+    results = {}
+    lines = []
+    for node in nodes:
+        if overwrite:
+            node_outputs(network, node, rm_exist=True)
+        if node_outputs(network, node, exist="all"):
+            results[node.name] = SignResult(node.name, True)
+        elif node_outputs(network, node, exist="any"):
+            files = ", ".join(node_outputs(network, node))
+            results[node.name] = SignResult(
+                node.name, False, f"Missing some of the following files: {files}"
+            )
+        else:
+            args = [node.name] + shlex.split(sign_command(network, node))
+            lines.append("run " + " ".join(shlex.quote(a) for a in args))
+    if lines:
+        binary = nebula_cert_binary(network)
+        # One script per batch so that concurrent batches of a network never overwrite each other
+        script = os.path.join(network.temp.dir, f"sign_batch_{uuid.uuid4().hex[:12]}.sh")
+        with open(script, "wt") as f:
+            f.write(
+                f"NEBULA_CERT={shlex.quote(binary)}\n"
+                "run() {\n"
+                '    name="$1"; shift\n'
+                '    if out=$("$NEBULA_CERT" "$@" 2>&1); then printf "ok\\t%s\\n" "$name";\n'
+                '    else printf "fail\\t%s\\t%s\\n" "$name" "$(printf %s "$out" | tr "\\n\\t" "  ")"; fi\n'
+                "}\n"
+            )
+            f.write("\n".join(lines) + "\n")
+        workingdir = get_working_dir(network)
+        try:
+            output = docker_client().containers.run(
+                name=container_name("network", network.cert_authority, "sign_batch"),
+                image=SHELL_IMAGE,
+                command=["sh", script],
+                remove=True,
+                detach=False,
+                working_dir=workingdir,
+                volumes=[f"{workingdir}:{workingdir}"],
+            )
+        finally:
+            os.unlink(script)
+        results.update(_parse_batch_output(output))
+    return [
+        results.get(node.name, SignResult(node.name, False, "No result from the signing batch"))
+        for node in nodes
+    ]
+
+
+def _parse_batch_output(output):
+    """`SignResult`s by node name from the status lines printed by the `sign_nodes_batch` script."""
+    results = {}
+    for line in output.decode().splitlines():
+        status, _, rest = line.partition("\t")
+        name, _, error = rest.partition("\t")
+        if status == "ok":
+            results[name] = SignResult(name, True)
+        elif status == "fail":
+            results[name] = SignResult(name, False, error)
+    return results
+
+
+WORKER_IDLE_TIMEOUT = 60.0
+"""Seconds a `SigningWorker` container stays up without signing anything"""
+
+
+class SigningWorker:
+    """Warm `SHELL_IMAGE` container of a network that signs node certificates with `exec_run`.
+
+    Signing a node then costs a process exec in a running container instead of a container start-up. The
+    container is started on first use and removed once it has been idle for `idle_timeout` seconds (it is
+    started again by the next `sign`). Get the worker of a network with `signing_worker`.
+
+    Args:
+        network (NebulaNetwork): Network whose nodes are signed.
+        idle_timeout (float): Idle seconds before the container is removed (default is `WORKER_IDLE_TIMEOUT`).
+    """
+
+    def __init__(self, network, idle_timeout=WORKER_IDLE_TIMEOUT):
+        self.network = network
+        self.idle_timeout = idle_timeout
+        self.container = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_used = 0.0
+        self._timer = None
+
+    def _start(self):
+        binary = nebula_cert_binary(self.network)
+        workingdir = get_working_dir(self.network)
+        self.container = docker_client().containers.run(
+            name=container_name("network", self.network.cert_authority, "sign_worker"),
+            image=SHELL_IMAGE,
+            command=["tail", "-f", "/dev/null"],
+            auto_remove=True,
+            detach=True,
+            working_dir=workingdir,
+            volumes=[f"{workingdir}:{workingdir}"],
+        )
+        self._binary = binary
+
+    def run(self, cmd):
+        """Run `nebula-cert` with the arguments of string `cmd` in the worker container.
+
+        Returns:
+            tuple[int, bytes]: Exit code and combined output.
+        """
+        with self._lock:
+            if self.container is None:
+                self._start()
+            container = self.container
+            self._active += 1
+        try:
+            return container.exec_run([self._binary] + shlex.split(cmd))
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.monotonic()
+                self._schedule(self.idle_timeout)
+
+    def sign(self, node, overwrite=False) -> SignResult:
+        """Sign the certificate of `node` like `sign_node`, reporting failures in the result."""
+        make_temp_dir(self.network)
+        network_cert(network=self.network)
+        if overwrite:
+            node_outputs(self.network, node, rm_exist=True)
+        if node_outputs(self.network, node, exist="all"):
+            return SignResult(node.name, True)
+        if node_outputs(self.network, node, exist="any"):
+            files = ", ".join(node_outputs(self.network, node))
+            return SignResult(node.name, False, f"Missing some of the following files: {files}")
+        code, output = self.run(sign_command(self.network, node))
+        if code != 0:
+            return SignResult(node.name, False, output.decode().strip())
+        return SignResult(node.name, True)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            idle = time.monotonic() - self._last_used
+            if self._active or idle < self.idle_timeout:
+                self._schedule(self.idle_timeout - idle if not self._active else self.idle_timeout)
+                return
+            self._stop()
+
+    def _stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.container is not None:
+            container, self.container = self.container, None
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError:
+                pass
+
+    def close(self):
+        """Remove the worker container now."""
+        with self._lock:
+            self._stop()
+
+
+_workers: Dict[Any, SigningWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def signing_worker(network, idle_timeout=None) -> SigningWorker:
+    """`SigningWorker` of `network`, shared by every caller signing nodes of the same CA and outputs directory.
+
+    Args:
+        network (NebulaNetwork): Network whose nodes are signed.
+        idle_timeout (float | None): New idle timeout of the worker (default is None to keep the current one,
+            `WORKER_IDLE_TIMEOUT` for a new worker).
+
+    Returns:
+        SigningWorker
+    """
+    key = (network.temp.ca_cert_prefix, get_working_dir(network))
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None:
+            worker = _workers[key] = SigningWorker(network)
+        if idle_timeout is not None:
+            worker.idle_timeout = idle_timeout
+        return worker
+
+
+@atexit.register
+def close_workers():
+    """Remove the containers of every `SigningWorker`."""
+    with _workers_lock:
+        for worker in _workers.values():
+            worker.close()
+
+
 def network_cert(network, overwrite=False):
     """[TODO:description]
 
@@ -194,7 +617,6 @@ def network_cert(network, overwrite=False):
         ValueError: [TODO:throw]
     """
     make_temp_dir(network)
-    ca_out = network.temp.ca_cert_prefix
     if overwrite:
         ca_outputs(network, rm_exist=True)
     # else:
@@ -202,26 +624,28 @@ def network_cert(network, overwrite=False):
     #         network,
     #         exist="any",
     #     )
-    cmd = f"ca -name {network.cert_authority} -ips {network.network} -out-key {ca_out}.key -out-crt {ca_out}.crt -out-qr {ca_out}.png"
-    cname = f"network_CA_certificate_{network.cert_authority}_docker"
+    cmd = ca_command(network)
+    cname = container_name("network_CA_certificate", network.cert_authority)
     workingdir = get_working_dir(network)
-    if not ca_outputs(network, exist="all"):
-        if ca_outputs(network, exist="any"):
-            f = ca_outputs(network)
-            raise ValueError(f"Missing some of the following files: {f}")
-        try:
-            cert_container = dclient.containers.run(
-                name=cname,
-                image=nebula_image,
-                command=cmd,
-                entrypoint="/nebula-cert",
-                auto_remove=True,
-                detach=False,
-                working_dir=workingdir,
-                volumes=[f"{workingdir}:{workingdir}"],
-            )
-        except Exception as me:
-            raise me
+    # Concurrent signers all check for the CA, only one of them may create it
+    with _ca_lock:
+        if not ca_outputs(network, exist="all"):
+            if ca_outputs(network, exist="any"):
+                f = ca_outputs(network)
+                raise ValueError(f"Missing some of the following files: {f}")
+            try:
+                cert_container = docker_client().containers.run(
+                    name=cname,
+                    image=nebula_image,
+                    command=cmd,
+                    entrypoint="/nebula-cert",
+                    auto_remove=True,
+                    detach=False,
+                    working_dir=workingdir,
+                    volumes=[f"{workingdir}:{workingdir}"],
+                )
+            except Exception as me:
+                raise me
 
 
 def save_config(network, node):
@@ -234,20 +658,19 @@ def save_config(network, node):
     Yields:
         [TODO:description]
     """
-    if node is not None:
-        if type(node) is not str:
-            name = node.name
-    else:
-        name = node
+    name = node if node is None or type(node) is str else node.name
     nodes = network.get_nodes(name)
     for node in nodes:
         name = node.name
         config_output_path = network.temp.node_config(name)
+        # Configs derived by the network are released once written
         yield node.dump_config(
             output=config_output_path.format(
                 node_name=node.name, ca=network.cert_authority
-            )
+            ),
+            config=network.node_config(node, cache=False),
         )
+        network.release_node_configs(node)
 
 
 def save_configs(network, node=None):
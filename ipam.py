@@ -0,0 +1,586 @@
+"""IP address management for Nebula overlay networks.
+
+Free address space is stored as sorted, disjoint runs of integers rather than as a set of every host,
+so the cost of a pool grows with the number of assigned addresses and not with the size of the network.
+
+```python
+pool = AddressPool("10.100.0.0/16", taken=["10.100.0.5"])
+pool.allocate()  # IPv4Address('10.100.0.1')
+```
+"""
+
+import hashlib
+import ipaddress
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+import numpy as np
+import yaml
+
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def host_bounds(network) -> Tuple[int, int]:
+    """First and last usable host of `network` as integers, following `ipaddress` `.hosts()` semantics.
+
+    Args:
+        network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Network to compute the host range for.
+
+    Returns:
+        tuple[int, int]
+    """
+    network = ipaddress.ip_network(network)
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen >= network.max_prefixlen - 1:
+        # /31 and /32 (or /127 and /128) use every address
+        return first, last
+    if network.version == 4:
+        # Skip the network and broadcast addresses
+        return first + 1, last - 1
+    # Skip the Subnet-Router anycast address
+    return first + 1, last
+
+
+def find_conflicts(network, addresses: Iterable) -> Tuple[List[List[int]], List[int]]:
+    """Find colliding and out of range addresses with a single sort.
+
+    Args:
+        network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Network the addresses must be usable hosts of.
+        addresses (Iterable): Addresses to check, None entries are skipped.
+
+    Returns:
+        tuple[list[list[int]], list[int]]: Groups of indices of `addresses` sharing the same address, and indices
+            of addresses that are not usable hosts of `network` (including addresses of the other IP version).
+    """
+    network = ipaddress.ip_network(network)
+    first, last = host_bounds(network)
+    indices, values, out_of_range = [], [], []
+    for i, addr in enumerate(addresses):
+        if addr is None:
+            continue
+        if not isinstance(addr, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            addr = ipaddress.ip_address(addr)
+        value = int(addr)
+        if addr.version != network.version or value < first or value > last:
+            out_of_range.append(i)
+            continue
+        indices.append(i)
+        values.append(value)
+    if len(values) < 2:
+        return [], out_of_range
+    values = np.array(values, dtype=np.int64 if network.version == 4 else object)
+    order = np.argsort(values, kind="stable")
+    ordered = values[order]
+    same = np.asarray(ordered[1:] == ordered[:-1], dtype=bool)
+    if not same.any():
+        return [], out_of_range
+    # Keep only the sorted entries that are equal to a neighbour, then split them into runs of equal values
+    shared = np.zeros(len(ordered), dtype=bool)
+    shared[1:] |= same
+    shared[:-1] |= same
+    collisions = []
+    run = []
+    previous = None
+    for j, value in zip(order[shared].tolist(), ordered[shared].tolist()):
+        if run and value != previous:
+            collisions.append(run)
+            run = []
+        run.append(indices[j])
+        previous = value
+    collisions.append(run)
+    return collisions, out_of_range
+
+
+class AddressPool:
+    """Free host addresses of a network stored as sorted inclusive `[start, end]` integer intervals.
+
+    Reserving, releasing and allocating addresses cost O(log n) lookups in the number of intervals,
+    which is bounded by the number of reserved addresses plus one.
+
+    Args:
+        network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Network to allocate hosts from.
+        taken (Iterable): Addresses that are already in use. Addresses outside of the host range are ignored.
+        bounds (tuple[int, int] | None): First and last host as integers, overriding the `host_bounds` of
+            `network`. Used for sub-pools whose usable range follows the enclosing network.
+    """
+
+    def __init__(
+        self, network, taken: Iterable = (), bounds: Tuple[int, int] | None = None
+    ):
+        self.network = ipaddress.ip_network(network)
+        self._address = type(self.network.network_address)
+        self.first, self.last = host_bounds(self.network) if bounds is None else bounds
+        # Offsets from `self.first` fit in uint64 for every IPv4 network and IPv6 networks down to /64
+        self._vectorized = self.last - self.first < 2**64 - 1
+        taken = [self._int(a) for a in taken]
+        if self._vectorized:
+            self._starts, self._ends = self._free_intervals(taken)
+            return
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        start = self.first
+        for addr in sorted(set(taken)):
+            if addr < self.first or addr > self.last:
+                continue
+            if addr > start:
+                self._starts.append(start)
+                self._ends.append(addr - 1)
+            start = addr + 1
+        if start <= self.last:
+            self._starts.append(start)
+            self._ends.append(self.last)
+
+    def _free_intervals(self, taken: List[int]) -> Tuple[List[int], List[int]]:
+        """Free intervals around the `taken` addresses, computed on sorted uint64 offsets from `self.first`."""
+        size = self.last - self.first + 1
+        if self.network.version == 4:
+            addrs = np.array(taken, dtype=np.int64)
+            addrs = addrs[(addrs >= self.first) & (addrs <= self.last)]
+            offsets = (addrs - self.first).astype(np.uint64)
+        else:
+            offsets = np.array(
+                [a - self.first for a in taken if self.first <= a <= self.last],
+                dtype=np.uint64,
+            )
+        offsets = np.unique(offsets)
+        # Gaps run from one past each taken address to just before the next one
+        starts = np.concatenate([np.zeros(1, np.uint64), offsets + np.uint64(1)])
+        stops = np.concatenate([offsets, np.array([size], dtype=np.uint64)])
+        gaps = starts < stops
+        starts = starts[gaps].tolist()
+        ends = (stops[gaps] - np.uint64(1)).tolist()
+        return [self.first + s for s in starts], [self.first + e for e in ends]
+
+    def __len__(self) -> int:
+        """Number of free addresses left in the pool, see `free_count` for IPv6 networks wider than /65."""
+        count = self.free_count()
+        if count > sys.maxsize:
+            raise OverflowError(f"{count} free addresses in {self.network} do not fit len(), use free_count()")
+        return count
+
+    def free_count(self) -> int:
+        """Number of free addresses left in the pool."""
+        return sum(e - s + 1 for s, e in zip(self._starts, self._ends))
+
+    def __contains__(self, addr) -> bool:
+        """True if `addr` is a free address of the pool."""
+        return self._find(self._int(addr)) >= 0
+
+    def __repr__(self) -> str:
+        return f"AddressPool({str(self.network)!r}, intervals={len(self._starts)})"
+
+    def _int(self, addr) -> int:
+        """Integer value of an address of the pool network's IP version."""
+        if type(addr) is int or isinstance(addr, self._address):
+            return int(addr)
+        return int(self._address(addr))
+
+    def _find(self, addr: int) -> int:
+        """Index of the free interval holding `addr` or -1."""
+        i = bisect_right(self._starts, addr) - 1
+        if i >= 0 and addr <= self._ends[i]:
+            return i
+        return -1
+
+    def in_range(self, addr) -> bool:
+        """True if `addr` is a usable host address of the pool network, free or not."""
+        return self.first <= self._int(addr) <= self.last
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        """Free address intervals as inclusive `(start, end)` integer tuples."""
+        return list(zip(self._starts, self._ends))
+
+    def reserve(self, addr) -> bool:
+        """Mark `addr` as used.
+
+        Args:
+            addr (str | int | ipaddress.IPv4Address | ipaddress.IPv6Address): Address to reserve.
+
+        Returns:
+            bool: False if `addr` was not free (already reserved or outside of the host range).
+        """
+        addr = self._int(addr)
+        i = self._find(addr)
+        if i < 0:
+            return False
+        start, end = self._starts[i], self._ends[i]
+        if start == end:
+            del self._starts[i]
+            del self._ends[i]
+        elif addr == start:
+            self._starts[i] = addr + 1
+        elif addr == end:
+            self._ends[i] = addr - 1
+        else:
+            self._ends[i] = addr - 1
+            self._starts.insert(i + 1, addr + 1)
+            self._ends.insert(i + 1, end)
+        return True
+
+    def release(self, addr) -> bool:
+        """Return `addr` to the pool of free addresses.
+
+        Args:
+            addr (str | int | ipaddress.IPv4Address | ipaddress.IPv6Address): Address to release.
+
+        Returns:
+            bool: False if `addr` was already free or is outside of the host range.
+        """
+        addr = self._int(addr)
+        if not self.in_range(addr) or self._find(addr) >= 0:
+            return False
+        i = bisect_right(self._starts, addr)
+        joins_left = i > 0 and self._ends[i - 1] == addr - 1
+        joins_right = i < len(self._starts) and self._starts[i] == addr + 1
+        if joins_left and joins_right:
+            self._ends[i - 1] = self._ends[i]
+            del self._starts[i]
+            del self._ends[i]
+        elif joins_left:
+            self._ends[i - 1] = addr
+        elif joins_right:
+            self._starts[i] = addr
+        else:
+            self._starts.insert(i, addr)
+            self._ends.insert(i, addr)
+        return True
+
+    def exclude(self, network) -> None:
+        """Remove every address of `network` (e.g. a sub-pool carved out of this pool) from the free addresses.
+
+        Args:
+            network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Range to exclude.
+        """
+        network = ipaddress.ip_network(network)
+        low, high = int(network.network_address), int(network.broadcast_address)
+        i = bisect_left(self._ends, low)
+        j = bisect_right(self._starts, high)
+        if i >= j:
+            return
+        starts, ends = [], []
+        if self._starts[i] < low:
+            starts.append(self._starts[i])
+            ends.append(low - 1)
+        if self._ends[j - 1] > high:
+            starts.append(high + 1)
+            ends.append(self._ends[j - 1])
+        self._starts[i:j] = starts
+        self._ends[i:j] = ends
+
+    def allocate(self):
+        """Reserve and return the lowest free address.
+
+        Raises:
+            ValueError: The pool is exhausted.
+
+        Returns:
+            ipaddress.IPv4Address | ipaddress.IPv6Address
+        """
+        if not self._starts:
+            raise ValueError(f"No free addresses left in {self.network}")
+        addr = self._starts[0]
+        self.reserve(addr)
+        return self._address(addr)
+
+    def allocate_from(self, addr):
+        """Reserve and return `addr` if it is free, otherwise the next free address after it (wrapping around).
+
+        Args:
+            addr (str | int | ipaddress.IPv4Address | ipaddress.IPv6Address): Preferred address.
+
+        Raises:
+            ValueError: The pool is exhausted.
+
+        Returns:
+            ipaddress.IPv4Address | ipaddress.IPv6Address
+        """
+        if not self._starts:
+            raise ValueError(f"No free addresses left in {self.network}")
+        addr = self._int(addr)
+        i = bisect_left(self._ends, addr)
+        if i == len(self._ends):
+            addr, i = self._starts[0], 0
+        addr = max(addr, self._starts[i])
+        self.reserve(addr)
+        return self._address(addr)
+
+    def allocate_hashed(self, key: str):
+        """Reserve an address derived from a hash of `key`, probing upwards on collision, see `allocate_from`.
+
+        Independent processes that allocate the same keys in the same order get the same addresses.
+
+        Args:
+            key (str): Stable identifier such as a node name.
+
+        Raises:
+            ValueError: The pool is exhausted.
+
+        Returns:
+            ipaddress.IPv4Address | ipaddress.IPv6Address
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        offset = int.from_bytes(digest, "big") % (self.last - self.first + 1)
+        return self.allocate_from(self.first + offset)
+
+    def allocate_array(self, count: int) -> np.ndarray:
+        """Reserve the `count` lowest free addresses in a single vectorized step.
+
+        Args:
+            count (int): Number of addresses to reserve.
+
+        Raises:
+            ValueError: The pool has fewer than `count` free addresses.
+
+        Returns:
+            numpy.ndarray: `uint32` addresses for IPv4 networks, or `(count, 2)` `uint64` high and low words for IPv6.
+        """
+        if count <= 0:
+            if self.network.version == 4:
+                return np.zeros(0, dtype=np.uint32)
+            return np.zeros((0, 2), dtype=np.uint64)
+        if not self._vectorized:
+            addrs = [int(a) for a in self._allocate_loop(count)]
+            hi = np.array([a >> 64 for a in addrs], dtype=np.uint64)
+            lo = np.array([a & (2**64 - 1) for a in addrs], dtype=np.uint64)
+            return np.stack([hi, lo], axis=1)
+        offsets = self._allocate_vectorized(count)
+        if self.network.version == 4:
+            return (offsets + np.uint64(self.first)).astype(np.uint32)
+        lo_first = np.uint64(self.first & (2**64 - 1))
+        lo = offsets + lo_first
+        carry = (lo < lo_first).astype(np.uint64)
+        hi = carry + np.uint64(self.first >> 64)
+        return np.stack([hi, lo], axis=1)
+
+    def allocate_many(self, count: int) -> List:
+        """Reserve and return the `count` lowest free addresses, see `allocate_array`.
+
+        Args:
+            count (int): Number of addresses to reserve.
+
+        Raises:
+            ValueError: The pool has fewer than `count` free addresses.
+
+        Returns:
+            list[ipaddress.IPv4Address | ipaddress.IPv6Address]
+        """
+        if count <= 0:
+            return []
+        if not self._vectorized:
+            return self._allocate_loop(count)
+        first = self.first
+        return [self._address(first + o) for o in self._allocate_vectorized(count).tolist()]
+
+    def _allocate_loop(self, count: int) -> List:
+        if count > self.free_count():
+            raise ValueError(f"Not enough free addresses left in {self.network} for {count} nodes")
+        return [self.allocate() for _ in range(count)]
+
+    def _allocate_vectorized(self, count: int) -> np.ndarray:
+        """Take the `count` lowest free addresses as uint64 offsets from `self.first`."""
+        # Every interval holds at least one address, so at most `count` intervals are needed
+        n = min(count, len(self._starts))
+        first = self.first
+        starts = np.array([s - first for s in self._starts[:n]], dtype=np.uint64)
+        ends = np.array([e - first for e in self._ends[:n]], dtype=np.uint64)
+        lengths = ends - starts + np.uint64(1)
+        cum = np.cumsum(lengths, dtype=np.uint64)
+        if n == 0 or cum[-1] < count:
+            raise ValueError(f"Not enough free addresses left in {self.network} for {count} nodes")
+        idx = np.arange(count, dtype=np.uint64)
+        interval = np.searchsorted(cum, idx, side="right")
+        before = cum - lengths
+        offsets = starts[interval] + (idx - before[interval])
+        # Drop the intervals that were used up and trim the last one
+        last = int(interval[-1])
+        used = int(offsets[-1]) + first
+        if used == self._ends[last]:
+            del self._starts[: last + 1]
+            del self._ends[: last + 1]
+        else:
+            self._starts[last] = used + 1
+            del self._starts[:last]
+            del self._ends[:last]
+        return offsets
+
+
+class PoolSet:
+    """Free addresses of a network split into named sub-pools and the pool of the rest of the network.
+
+    Args:
+        network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Network to allocate hosts from.
+        pools (Mapping[str, str | ipaddress.IPv4Network | ipaddress.IPv6Network] | None): Named, non-overlapping
+            sub-ranges of `network`. Their addresses are carved out of the main pool.
+        taken (Iterable): Addresses that are already in use.
+    """
+
+    def __init__(self, network, pools: Mapping | None = None, taken: Iterable = ()):
+        taken = list(taken)
+        self.main = AddressPool(network, taken=taken)
+        self.pools: Dict[str, AddressPool] = {}
+        subnets = [(k, ipaddress.ip_network(v)) for k, v in (pools or {}).items()]
+        for name, subnet in sorted(subnets, key=lambda p: p[1].network_address):
+            self.main.exclude(subnet)
+            bounds = (
+                max(int(subnet.network_address), self.main.first),
+                min(int(subnet.broadcast_address), self.main.last),
+            )
+            self.pools[name] = AddressPool(subnet, taken=taken, bounds=bounds)
+        self._names = list(self.pools.keys())
+        self._firsts = [p.first for p in self.pools.values()]
+
+    def get(self, name: str | None) -> AddressPool:
+        """Pool named `name`, or the main pool if `name` is None.
+
+        Raises:
+            ValueError: No pool named `name`.
+        """
+        if name is None:
+            return self.main
+        if name not in self.pools:
+            raise ValueError(f"Pool {name} does not exist in {self.main.network}")
+        return self.pools[name]
+
+    def name_of(self, addr) -> str | None:
+        """Name of the sub-pool whose range holds `addr`, or None for the main pool."""
+        addr = self.main._int(addr)
+        i = bisect_right(self._firsts, addr) - 1
+        if i >= 0 and addr <= self.pools[self._names[i]].last:
+            return self._names[i]
+        return None
+
+    def pool_of(self, addr) -> AddressPool:
+        """Pool whose range holds `addr`."""
+        return self.get(self.name_of(addr))
+
+    def allocate(self, name: str | None, keys: List[str], hashed: bool = False) -> List:
+        """Reserve one address per key from pool `name`.
+
+        Args:
+            name (str | None): Pool to allocate from, None for the main pool.
+            keys (list[str]): Stable identifiers (node names) to allocate for.
+            hashed (bool): Place addresses by `AddressPool.allocate_hashed` in key order instead of taking the
+                lowest free addresses (default is False).
+
+        Raises:
+            ValueError: The pool does not exist or has too few free addresses. Nothing is reserved.
+
+        Returns:
+            list[ipaddress.IPv4Address | ipaddress.IPv6Address]: Addresses in the order of `keys`.
+        """
+        pool = self.get(name)
+        if not hashed:
+            return pool.allocate_many(len(keys))
+        addrs = {}
+        try:
+            # Probe in key order so collisions resolve the same way in every process
+            for key in sorted(keys):
+                addrs[key] = pool.allocate_hashed(key)
+        except ValueError:
+            for addr in addrs.values():
+                pool.release(addr)
+            raise
+        return [addrs[k] for k in keys]
+
+
+class AddressLedger:
+    """Persistent record of node name to IP address assignments.
+
+    A `NebulaNetwork` with a ledger reuses the recorded address of a node instead of computing it from the
+    node's position in the node list, so adding or removing nodes never moves the address (and invalidates the
+    certificate) of any other node. Entries of nodes that are no longer part of the network keep their address
+    reserved until they are removed with `pop`.
+
+    Saving appends only the entries that changed to the file (`null` for removed nodes), so recording one node
+    costs O(1) regardless of the size of the ledger. The file is rewritten with the current assignments alone
+    when it is loaded or once the appended entries outnumber them.
+
+    Args:
+        path (str | None): YAML file the ledger is loaded from and saved to. If None, the ledger is in memory only.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.assignments: Dict[str, str] = {}
+        self.changed = False
+        # Entries changed since the last save, None for removed nodes
+        self._pending: Dict[str, str | None] = {}
+        # File that the pending entries can be appended to and the number of entries appended to it so far
+        self._appendable: str | None = None
+        self._appended = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+    def __contains__(self, name) -> bool:
+        return name in self.assignments
+
+    def __iter__(self):
+        return iter(self.assignments.items())
+
+    def get(self, name: str) -> str | None:
+        """Recorded address of node `name` or None."""
+        return self.assignments.get(name)
+
+    def set(self, name: str, addr) -> None:
+        """Record `addr` as the address of node `name`."""
+        addr = str(addr)
+        if self.assignments.get(name) != addr:
+            self.assignments[name] = addr
+            self._pending[name] = addr
+            self.changed = True
+
+    def pop(self, name: str) -> str | None:
+        """Forget the address of node `name` and return it."""
+        addr = self.assignments.pop(name, None)
+        if addr is not None:
+            self._pending[name] = None
+            self.changed = True
+        return addr
+
+    def load(self) -> None:
+        """Read assignments from `self.path`, compacting the file if entries were appended to it."""
+        with open(self.path, "rt") as f:
+            loader = _YamlLoader(f)
+            try:
+                node = loader.get_single_node()
+                contents = {} if node is None else loader.construct_document(node) or {}
+            finally:
+                loader.dispose()
+        self.assignments = {str(k): str(v) for k, v in contents.items() if v is not None}
+        self.changed = False
+        self._pending = {}
+        if isinstance(node, yaml.MappingNode) and len(node.value) > len(self.assignments):
+            self._write()
+        elif isinstance(node, yaml.MappingNode) and not node.flow_style:
+            self._appendable, self._appended = self.path, 0
+
+    def save(self) -> None:
+        """Write the assignments that changed since the last load or save to `self.path`."""
+        if self.path is None or not self.changed:
+            return
+        appendable = self._pending and self._appendable == self.path
+        if appendable and self._appended + len(self._pending) <= len(self.assignments):
+            with open(self.path, "at") as f:
+                yaml.dump(self._pending, f, Dumper=_YamlDumper, sort_keys=False)
+            self._appended += len(self._pending)
+        else:
+            self._write()
+        self._pending = {}
+        self.changed = False
+
+    def _write(self) -> None:
+        """Atomically rewrite `self.path` with the current assignments."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wt") as f:
+            yaml.dump(self.assignments, f, Dumper=_YamlDumper, sort_keys=False)
+        os.replace(tmp, self.path)
+        # An empty ledger is written as a flow mapping, which block entries cannot be appended to
+        self._appendable = self.path if self.assignments else None
+        self._appended = 0
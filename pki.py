@@ -0,0 +1,395 @@
+"""In-process Nebula certificates, without Docker or the `nebula-cert` binary.
+
+Produces the same artifacts as `nebula-cert ca` and `nebula-cert sign`: v1 Nebula certificates (protobuf
+encoded and signed with Ed25519), Ed25519 CA keys and X25519 host keys, PEM encoded with the Nebula banners.
+
+```python
+ca_crt, ca_key = create_ca("My CA", "10.100.0.0/16")
+host_key, host_pub = create_keypair()
+host_crt = sign(ca_crt, ca_key, "mynode", "10.100.0.5/16", host_pub)
+```
+
+`network_cert` and `sign_node` write those to the `io.ca_outputs` and `io.node_outputs` paths of a network.
+QR code images are never produced, even with `NebulaNetwork.qr`, and only IPv4 networks are supported as v1 certificates cannot hold IPv6
+addresses. Requires the optional `cryptography` package, installed by the `pki` environment of `pixi.toml`.
+"""
+
+import base64
+import hashlib
+import ipaddress
+import os
+import time
+from typing import Any, Dict, Iterable, Tuple
+
+try:
+    from cryptography.hazmat.primitives.asymmetric import ed25519, x25519
+    from cryptography.hazmat.primitives.serialization import (Encoding,
+                                                              PublicFormat)
+except ImportError:
+    ed25519 = x25519 = None
+
+CERTIFICATE_BANNER = "NEBULA CERTIFICATE"
+ED25519_PRIVATE_KEY_BANNER = "NEBULA ED25519 PRIVATE KEY"
+X25519_PRIVATE_KEY_BANNER = "NEBULA X25519 PRIVATE KEY"
+X25519_PUBLIC_KEY_BANNER = "NEBULA X25519 PUBLIC KEY"
+
+CA_DURATION = 365 * 24 * 3600
+"""Default CA lifetime in seconds, one year like `nebula-cert ca`"""
+
+# Field numbers of the RawNebulaCertificateDetails protobuf message
+_NAME, _IPS, _SUBNETS, _GROUPS, _NOT_BEFORE, _NOT_AFTER, _PUBLIC_KEY, _IS_CA, _ISSUER = range(1, 10)
+_CURVE = 100
+"""Curve field number, CURVE25519 is the default (0) value and is omitted"""
+# Field numbers of the RawNebulaCertificate protobuf message
+_DETAILS, _SIGNATURE = 1, 2
+
+
+def _require_cryptography():
+    if ed25519 is None:
+        raise ImportError(
+            "The in-process certificate backend requires the optional cryptography package, "
+            "install it or use the pki pixi environment (pixi run -e pki ...)"
+        )
+
+
+def pem_encode(banner: str, data: bytes) -> bytes:
+    """PEM block of `data` with `banner`, base64 wrapped at 64 characters like Go's `pem.Encode`."""
+    b64 = base64.b64encode(data).decode()
+    lines = "".join(b64[i : i + 64] + "\n" for i in range(0, len(b64), 64))
+    return f"-----BEGIN {banner}-----\n{lines}-----END {banner}-----\n".encode()
+
+
+def pem_decode(pem: bytes | str, banner: str) -> bytes:
+    """Contents of the first PEM block of `pem`, which must have `banner`.
+
+    Raises:
+        ValueError: No PEM block or a different banner.
+    """
+    if type(pem) is bytes:
+        pem = pem.decode()
+    begin = pem.find("-----BEGIN ")
+    if begin < 0:
+        raise ValueError("No PEM block found")
+    header_end = pem.index("-----", begin + 11)
+    found = pem[begin + 11 : header_end]
+    if found != banner:
+        raise ValueError(f"Expected a {banner} PEM block, got {found}")
+    end = pem.index(f"-----END {banner}-----", header_end)
+    return base64.b64decode("".join(pem[header_end + 5 : end].split()))
+
+
+def _varint(value: int) -> bytes:
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint(field << 3 | wire_type)
+
+
+def _bytes_field(field: int, value: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _ip_mask_pairs(networks: Iterable[ipaddress.IPv4Interface]) -> bytes:
+    """Packed uint32 address and netmask pairs, the encoding of the `Ips` and `Subnets` fields."""
+    return b"".join(_varint(int(n.ip)) + _varint(int(n.netmask)) for n in networks)
+
+
+def marshal_details(details: Dict[str, Any]) -> bytes:
+    """Protobuf encoding of certificate `details`, in field order and omitting default values like Go's
+    `proto.Marshal`.
+
+    Args:
+        details (dict): `name`, `ips` and `subnets` (lists of `ipaddress.IPv4Interface`), `groups`,
+            `not_before` and `not_after` (Unix seconds), `public_key`, `is_ca` and `issuer` (bytes of the
+            issuer fingerprint).
+
+    Returns:
+        bytes
+    """
+    out = b""
+    if details.get("name"):
+        out += _bytes_field(_NAME, details["name"].encode())
+    if details.get("ips"):
+        out += _bytes_field(_IPS, _ip_mask_pairs(details["ips"]))
+    if details.get("subnets"):
+        out += _bytes_field(_SUBNETS, _ip_mask_pairs(details["subnets"]))
+    for group in details.get("groups", ()):
+        out += _bytes_field(_GROUPS, group.encode())
+    if details.get("not_before"):
+        out += _key(_NOT_BEFORE, 0) + _varint(details["not_before"])
+    if details.get("not_after"):
+        out += _key(_NOT_AFTER, 0) + _varint(details["not_after"])
+    if details.get("public_key"):
+        out += _bytes_field(_PUBLIC_KEY, details["public_key"])
+    if details.get("is_ca"):
+        out += _key(_IS_CA, 0) + _varint(1)
+    if details.get("issuer"):
+        out += _bytes_field(_ISSUER, details["issuer"])
+    return out
+
+
+def unmarshal_details(data: bytes) -> Dict[str, Any]:
+    """Certificate details of protobuf `data`, the inverse of `marshal_details`."""
+    details = {
+        "name": "",
+        "ips": [],
+        "subnets": [],
+        "groups": [],
+        "not_before": 0,
+        "not_after": 0,
+        "public_key": b"",
+        "is_ca": False,
+        "issuer": b"",
+    }
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        if field == _NAME:
+            details["name"] = value.decode()
+        elif field in (_IPS, _SUBNETS):
+            ints, p = [], 0
+            while p < len(value):
+                i, p = _read_varint(value, p)
+                ints.append(i)
+            details["ips" if field == _IPS else "subnets"] += [
+                ipaddress.IPv4Interface(f"{ipaddress.IPv4Address(ip)}/{ipaddress.IPv4Address(mask)}")
+                for ip, mask in zip(ints[::2], ints[1::2])
+            ]
+        elif field == _GROUPS:
+            details["groups"].append(value.decode())
+        elif field in (_NOT_BEFORE, _NOT_AFTER):
+            details["not_before" if field == _NOT_BEFORE else "not_after"] = value - (
+                1 << 64 if value >= 1 << 63 else 0
+            )
+        elif field == _PUBLIC_KEY:
+            details["public_key"] = value
+        elif field == _IS_CA:
+            details["is_ca"] = bool(value)
+        elif field == _ISSUER:
+            details["issuer"] = value
+    return details
+
+
+def marshal_certificate(details: bytes, signature: bytes) -> bytes:
+    """Protobuf `RawNebulaCertificate` of marshalled `details` and their `signature`."""
+    return _bytes_field(_DETAILS, details) + _bytes_field(_SIGNATURE, signature)
+
+
+def unmarshal_certificate(data: bytes) -> Tuple[bytes, bytes]:
+    """Marshalled details and signature of a protobuf `RawNebulaCertificate`."""
+    parts = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        length, pos = _read_varint(data, pos)
+        parts[key >> 3] = data[pos : pos + length]
+        pos += length
+    return parts.get(_DETAILS, b""), parts.get(_SIGNATURE, b"")
+
+
+def read_certificate(pem: bytes | str) -> Dict[str, Any]:
+    """Details of a PEM certificate, plus its `signature` and `fingerprint` (hex SHA-256 of the certificate)."""
+    raw = pem_decode(pem, CERTIFICATE_BANNER)
+    details, signature = unmarshal_certificate(raw)
+    result = unmarshal_details(details)
+    result["signature"] = signature
+    result["fingerprint"] = hashlib.sha256(raw).hexdigest()
+    return result
+
+
+def verify(cert_pem: bytes | str, ca_cert_pem: bytes | str) -> bool:
+    """True if `cert_pem` is signed by the CA of `ca_cert_pem` and names it as issuer."""
+    _require_cryptography()
+    details, signature = unmarshal_certificate(pem_decode(cert_pem, CERTIFICATE_BANNER))
+    ca = read_certificate(ca_cert_pem)
+    if unmarshal_details(details)["issuer"] != bytes.fromhex(ca["fingerprint"]):
+        return False
+    try:
+        ed25519.Ed25519PublicKey.from_public_bytes(ca["public_key"]).verify(signature, details)
+    except Exception:
+        return False
+    return True
+
+
+def _sign(details: Dict[str, Any], private_key: bytes) -> bytes:
+    """PEM certificate of `details` signed with the 64 byte Ed25519 `private_key` (seed and public key)."""
+    marshalled = marshal_details(details)
+    signature = ed25519.Ed25519PrivateKey.from_private_bytes(private_key[:32]).sign(marshalled)
+    return pem_encode(CERTIFICATE_BANNER, marshal_certificate(marshalled, signature))
+
+
+def create_ca(
+    name: str,
+    networks: str | Iterable[str] = (),
+    groups: Iterable[str] = (),
+    duration: int = CA_DURATION,
+) -> Tuple[bytes, bytes]:
+    """Self-signed CA certificate and Ed25519 key, like `nebula-cert ca`.
+
+    Args:
+        name (str): CA name.
+        networks (str | Iterable[str]): IPv4 networks the CA may sign addresses of (default is () for any).
+        groups (Iterable[str]): Groups the CA may sign (default is () for any).
+        duration (int): Lifetime in seconds (default is `CA_DURATION`).
+
+    Returns:
+        tuple[bytes, bytes]: PEM certificate and PEM private key.
+    """
+    _require_cryptography()
+    key = ed25519.Ed25519PrivateKey.generate()
+    public = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    private = key.private_bytes_raw() + public
+    now = int(time.time())
+    details = {
+        "name": name,
+        "ips": [_interface(n) for n in ([networks] if type(networks) is str else networks)],
+        "groups": list(groups),
+        "not_before": now,
+        "not_after": now + duration,
+        "public_key": public,
+        "is_ca": True,
+    }
+    return _sign(details, private), pem_encode(ED25519_PRIVATE_KEY_BANNER, private)
+
+
+def create_keypair() -> Tuple[bytes, bytes]:
+    """X25519 host key pair, like `nebula-cert keygen`.
+
+    Returns:
+        tuple[bytes, bytes]: PEM private key and PEM public key.
+    """
+    _require_cryptography()
+    key = x25519.X25519PrivateKey.generate()
+    public = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return (
+        pem_encode(X25519_PRIVATE_KEY_BANNER, key.private_bytes_raw()),
+        pem_encode(X25519_PUBLIC_KEY_BANNER, public),
+    )
+
+
+def sign(
+    ca_cert: bytes | str,
+    ca_key: bytes | str,
+    name: str,
+    ip: str,
+    public_key: bytes | str,
+    groups: Iterable[str] = (),
+    duration: int | None = None,
+) -> bytes:
+    """Host certificate signed by a CA, like `nebula-cert sign`.
+
+    Args:
+        ca_cert (bytes | str): PEM CA certificate.
+        ca_key (bytes | str): PEM CA private key.
+        name (str): Host name.
+        ip (str): Host IPv4 address with the network prefix length, e.g. "10.100.0.5/16".
+        public_key (bytes | str): PEM X25519 host public key.
+        groups (Iterable[str]): Host groups (default is ()).
+        duration (int | None): Lifetime in seconds (default is None to expire one second before the CA).
+
+    Raises:
+        ValueError: The CA certificate and key do not match, or `ip` is not within the CA networks.
+
+    Returns:
+        bytes: PEM host certificate.
+    """
+    _require_cryptography()
+    ca = read_certificate(ca_cert)
+    private = pem_decode(ca_key, ED25519_PRIVATE_KEY_BANNER)
+    if private[32:] != ca["public_key"]:
+        raise ValueError("The CA key does not match the CA certificate")
+    interface = _interface(ip)
+    if ca["ips"] and not any(interface.ip in n.network for n in ca["ips"]):
+        raise ValueError(f"IP {interface.ip} is not within the CA networks")
+    now = int(time.time())
+    details = {
+        "name": name,
+        "ips": [interface],
+        "groups": list(groups),
+        "not_before": now,
+        "not_after": ca["not_after"] - 1 if duration is None else now + duration,
+        "public_key": pem_decode(public_key, X25519_PUBLIC_KEY_BANNER),
+        "issuer": bytes.fromhex(ca["fingerprint"]),
+    }
+    return _sign(details, private)
+
+
+def _interface(value) -> ipaddress.IPv4Interface:
+    interface = ipaddress.ip_interface(value)
+    if interface.version != 4:
+        raise ValueError(f"{value} is not IPv4, v1 Nebula certificates only hold IPv4 addresses")
+    return interface
+
+
+def _write(path: str, data: bytes, mode: int = 0o600):
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.chmod(f"{path}.tmp", mode)
+    os.replace(f"{path}.tmp", path)
+
+
+def network_cert(network, overwrite=False):
+    """In-process equivalent of `io.network_cert`, writing the CA certificate and key of `network`."""
+    from . import io as _io
+
+    _io.make_temp_dir(network)
+    ca_crt, ca_key = _io.ca_outputs(network)[:2]
+    if overwrite:
+        _io.ca_outputs(network, rm_exist=True)
+    if os.path.exists(ca_crt) and os.path.exists(ca_key):
+        return
+    if os.path.exists(ca_crt) or os.path.exists(ca_key):
+        raise ValueError(f"Missing some of the following files: {ca_crt}, {ca_key}")
+    cert, key = create_ca(network.cert_authority, str(network.network))
+    _write(ca_key, key)
+    _write(ca_crt, cert, 0o644)
+
+
+def sign_node(network, node, overwrite=False):
+    """In-process equivalent of `io.sign_node`, writing the certificate and key of `node`."""
+    from . import io as _io
+
+    network_cert(network)
+    if overwrite:
+        _io.node_outputs(network, node, rm_exist=True)
+    node_crt, node_key = _io.node_outputs(network, node)[:2]
+    if os.path.exists(node_crt) and os.path.exists(node_key):
+        return
+    if os.path.exists(node_crt) or os.path.exists(node_key):
+        raise ValueError(f"Missing some of the following files: {node_crt}, {node_key}")
+    ca_crt, ca_key = _io.ca_outputs(network)[:2]
+    with open(ca_crt, "rb") as f:
+        ca_cert = f.read()
+    with open(ca_key, "rb") as f:
+        ca_private = f.read()
+    private, public = create_keypair()
+    cert = sign(ca_cert, ca_private, node.name, f"{node.ip}/{network.cidr}", public)
+    _write(node_key, private)
+    _write(node_crt, cert, 0o644)
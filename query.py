@@ -0,0 +1,214 @@
+"""Node selectors for `NebulaNetwork.get_nodes`.
+
+Selectors are compiled once and evaluated against the network node indexes, so a selection costs lookups in
+the name, group, role and sorted IP indexes rather than a pass over every node per call.
+
+```python
+db = Group("db") & ~Role("lighthouse") & Subnet("10.100.4.0/22")
+net.get_nodes(where=db)
+# or the equivalent query string
+net.get_nodes(where="group:db and not role:lighthouse and in:10.100.4.0/22")
+```
+
+Query strings combine the terms `name:<glob>`, `re:<regex>`, `group:<name>`, `role:lighthouse|relay` and
+`in:<cidr>` with `and`/`&`, `or`/`|`, `not`/`!` and parentheses. Use `Name(pattern, regex=True)` for regular
+expressions containing whitespace, parentheses or `&|!`.
+"""
+
+import fnmatch
+import ipaddress
+import re
+from functools import lru_cache
+from typing import Set
+
+
+class Selector:
+    """Base class of node selectors, combine them with `&`, `|` and `~`."""
+
+    def names(self, network) -> Set[str]:
+        """Names of the nodes of `network` selected by this selector."""
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class All(Selector):
+    """Every node."""
+
+    def names(self, network):
+        return set(network._by_name)
+
+
+class Name(Selector):
+    """Nodes whose name matches a glob `pattern`, or a regular expression if `regex` is True."""
+
+    def __init__(self, pattern: str, regex: bool = False):
+        self.pattern = pattern
+        self.exact = not regex and not any(c in pattern for c in "*?[")
+        if not self.exact:
+            self._match = re.compile(
+                pattern if regex else fnmatch.translate(pattern)
+            ).fullmatch
+
+    def names(self, network):
+        if self.exact:
+            return {self.pattern} if self.pattern in network._by_name else set()
+        return set(filter(self._match, network._by_name))
+
+
+class Group(Selector):
+    """Nodes in firewall group `group`."""
+
+    def __init__(self, group: str):
+        self.group = group
+
+    def names(self, network):
+        return set(network._by_group.get(self.group, ()))
+
+
+class Role(Selector):
+    """Nodes with role "lighthouse" or "relay"."""
+
+    def __init__(self, role: str):
+        if role not in ("lighthouse", "relay"):
+            raise ValueError(f"Unknown role {role}, expected lighthouse or relay")
+        self.role = role
+
+    def names(self, network):
+        return set(network._by_role[self.role])
+
+
+class Subnet(Selector):
+    """Nodes whose IP is within `cidr`."""
+
+    def __init__(self, cidr):
+        self.network = ipaddress.ip_network(cidr)
+
+    def names(self, network):
+        return set(network._names_in_range(self.network))
+
+
+class And(Selector):
+    def __init__(self, *selectors: Selector):
+        self.selectors = selectors
+
+    def names(self, network):
+        # Evaluate in order and stop early once nothing is left
+        result = self.selectors[0].names(network)
+        for selector in self.selectors[1:]:
+            if not result:
+                break
+            result &= selector.names(network)
+        return result
+
+
+class Or(Selector):
+    def __init__(self, *selectors: Selector):
+        self.selectors = selectors
+
+    def names(self, network):
+        result = set()
+        for selector in self.selectors:
+            result |= selector.names(network)
+        return result
+
+
+class Not(Selector):
+    def __init__(self, selector: Selector):
+        self.selector = selector
+
+    def names(self, network):
+        return set(network._by_name) - self.selector.names(network)
+
+
+_TERMS = {
+    "name": Name,
+    "re": lambda p: Name(p, regex=True),
+    "group": Group,
+    "role": Role,
+    "in": Subnet,
+}
+_TOKENS = re.compile(r"\s*(\(|\)|&|\||!|[^\s()&|!]+)")
+
+
+@lru_cache(maxsize=256)
+def parse(query: str) -> Selector:
+    """Compile a query string into a `Selector`, see the module documentation for the syntax.
+
+    Args:
+        query (str): Query string.
+
+    Raises:
+        ValueError: The query is malformed.
+
+    Returns:
+        Selector
+    """
+    tokens = _TOKENS.findall(query)
+    if "".join(tokens) != "".join(query.split()):
+        raise ValueError(f"Cannot parse query {query!r}")
+    tokens = [
+        {"and": "&", "or": "|", "not": "!"}.get(t.lower(), t) for t in tokens
+    ]
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        selectors = [parse_and()]
+        while peek() == "|":
+            take()
+            selectors.append(parse_and())
+        return selectors[0] if len(selectors) == 1 else Or(*selectors)
+
+    def parse_and():
+        selectors = [parse_not()]
+        while peek() == "&":
+            take()
+            selectors.append(parse_not())
+        return selectors[0] if len(selectors) == 1 else And(*selectors)
+
+    def parse_not():
+        if peek() == "!":
+            take()
+            return Not(parse_not())
+        if peek() == "(":
+            take()
+            selector = parse_or()
+            if peek() != ")":
+                raise ValueError(f"Missing ) in query {query!r}")
+            take()
+            return selector
+        token = peek()
+        if token is None or ":" not in token:
+            raise ValueError(f"Expected a term like group:<name> in query {query!r}, got {token!r}")
+        take()
+        kind, value = token.split(":", 1)
+        if kind not in _TERMS:
+            raise ValueError(f"Unknown term {kind} in query {query!r}")
+        return _TERMS[kind](value)
+
+    selector = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos]!r} in query {query!r}")
+    return selector
+
+
+def compile(where: str | Selector) -> Selector:
+    """`Selector` for a query string or selector."""
+    if isinstance(where, Selector):
+        return where
+    return parse(where)
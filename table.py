@@ -0,0 +1,882 @@
+"""Columnar node storage for networks with very many nodes.
+
+A `NodeTable` keeps one NumPy array per node attribute instead of one Pydantic `NebulaNode` per node, and only
+materializes `NebulaNode` views for the rows a caller asks for. `NebulaNetwork.from_table` builds a network on
+top of a table (`TableNodes`), whose validation, IP allocation and lookups run on the columns.
+
+```python
+table = NodeTable.from_records({"name": f"node{i}", "groups": ["edge"]} for i in range(1_000_000))
+net = NebulaNetwork.from_table(table, cert_authority="My CA", ip="10.0.0.0", cidr=8)
+net.get_nodes(where="in:10.0.0.0/24")  # materializes 254 nodes
+```
+
+Firewall groups are stored by name only, nodes whose `groups` carry `config.InOutboundItem` port or protocol
+rules should be kept as `NebulaNode`s.
+"""
+
+import ipaddress
+from collections.abc import Mapping, MutableSequence, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from . import config as _config
+from . import ipam as _ipam
+
+LIGHTHOUSE = 1
+"""Role flag bit of lighthouse nodes"""
+RELAY = 2
+"""Role flag bit of relay nodes"""
+
+
+class NodeTable:
+    """Array-backed store of node records.
+
+    Columns are `ip` (`uint32` for IPv4, `(n, 2)` `uint64` high and low words for IPv6), `has_ip`, `port`
+    (`uint16`), `flags` (`LIGHTHOUSE` and `RELAY` bits) and `pool` (index into `pools`, -1 for none). Node names
+    are a list, group memberships are stored as compressed rows of group ids (`group_offsets`, `group_ids`) into
+    the `groups` vocabulary, and public addresses (usually lighthouses only) in a sparse mapping.
+
+    Args:
+        version (int): IP version of the node addresses, 4 (default) or 6.
+    """
+
+    def __init__(self, version: int = 4):
+        if version not in (4, 6):
+            raise ValueError(f"Unknown IP version {version}")
+        self.version = version
+        self.names: List[str] = []
+        self.groups: List[str] = []
+        self.pools: List[str] = []
+        self.public: Dict[int, _config.RoutableIPPort] = {}
+        self._rows: Dict[str, int] = {}
+        self._group_index: Dict[str, int] = {}
+        self._pool_index: Dict[str, int] = {}
+        self._size = 0
+        self._capacity = 0
+        # Number of writes to the IP column, tells `TableNodes` when its IP index is stale
+        self._changes = 0
+        self._n_group_ids = 0
+        self._ip = self._ip_column(0)
+        self._has_ip = np.zeros(0, dtype=bool)
+        self._port = np.zeros(0, dtype=np.uint16)
+        self._flags = np.zeros(0, dtype=np.uint8)
+        self._pool = np.zeros(0, dtype=np.int32)
+        self._group_offsets = np.zeros(1, dtype=np.int64)
+        self._group_ids = np.zeros(0, dtype=np.int32)
+
+    def _ip_column(self, size):
+        if self.version == 4:
+            return np.zeros(size, dtype=np.uint32)
+        return np.zeros((size, 2), dtype=np.uint64)
+
+    def _reserve(self, rows: int, group_ids: int):
+        """Grow the columns (doubling capacity) to hold `rows` rows and `group_ids` group memberships."""
+        if rows > self._capacity:
+            capacity = max(rows, 2 * self._capacity, 1024)
+            ip = self._ip_column(capacity)
+            ip[: self._size] = self._ip[: self._size]
+            self._ip = ip
+            for attr in ("_has_ip", "_port", "_flags", "_pool"):
+                old = getattr(self, attr)
+                new = np.zeros(capacity, dtype=old.dtype)
+                new[: self._size] = old[: self._size]
+                setattr(self, attr, new)
+            offsets = np.zeros(capacity + 1, dtype=np.int64)
+            offsets[: self._size + 1] = self._group_offsets[: self._size + 1]
+            self._group_offsets = offsets
+            self._capacity = capacity
+        if group_ids > len(self._group_ids):
+            new = np.zeros(max(group_ids, 2 * len(self._group_ids), 1024), dtype=np.int32)
+            new[: self._n_group_ids] = self._group_ids[: self._n_group_ids]
+            self._group_ids = new
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def ip(self) -> np.ndarray:
+        """IP column, valid where `has_ip` is True."""
+        return self._ip[: self._size]
+
+    @property
+    def has_ip(self) -> np.ndarray:
+        return self._has_ip[: self._size]
+
+    @property
+    def port(self) -> np.ndarray:
+        return self._port[: self._size]
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags[: self._size]
+
+    @property
+    def pool(self) -> np.ndarray:
+        """Pool column as indices into `pools`, -1 for rows without a pool."""
+        return self._pool[: self._size]
+
+    @property
+    def group_offsets(self) -> np.ndarray:
+        """Row `i` belongs to the groups `group_ids[group_offsets[i]:group_offsets[i + 1]]`."""
+        return self._group_offsets[: self._size + 1]
+
+    @property
+    def group_ids(self) -> np.ndarray:
+        """Group memberships of all rows as indices into `groups`."""
+        return self._group_ids[: self._n_group_ids]
+
+    def __contains__(self, name) -> bool:
+        return name in self._rows
+
+    def __getitem__(self, row: int):
+        """`NebulaNode` view of row `row`, see `node`."""
+        return self.node(row)
+
+    def __iter__(self):
+        for row in range(self._size):
+            yield self.node(row)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the array columns."""
+        return sum(
+            a.nbytes
+            for a in (self._ip, self._has_ip, self._port, self._flags, self._pool)
+        ) + self._group_offsets.nbytes + self._group_ids.nbytes
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[Mapping[str, Any] | Any], version: int = 4
+    ) -> "NodeTable":
+        """Table of `records`, see `append`."""
+        table = cls(version=version)
+        for record in records:
+            table.append(record)
+        return table
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable, version: int = 4) -> "NodeTable":
+        """Table of `NebulaNode`s, see `append`."""
+        return cls.from_records(nodes, version=version)
+
+    def row(self, name: str) -> int:
+        """Row of node `name`.
+
+        Raises:
+            KeyError: No node with that name in the table.
+        """
+        return self._rows[name]
+
+    def append(self, record: Mapping[str, Any] | Any) -> int:
+        """Add a node.
+
+        Args:
+            record (Mapping | NebulaNode): `NebulaNode` or mapping of its fields (`name`, `ip`, `port`,
+                `am_lighthouse`, `am_relay`, `groups`, `pool` and `public`).
+
+        Raises:
+            ValueError: A node with the same name is already in the table.
+
+        Returns:
+            int: Row of the node.
+        """
+        record = _fields(record)
+        name = str(record["name"])
+        if name in self._rows:
+            raise ValueError(f"Node {name} already exists in the table")
+        groups = [self._intern(self._group_index, self.groups, g) for g in record.get("groups") or ()]
+        row = self._size
+        self._reserve(row + 1, self._n_group_ids + len(groups))
+        self.names.append(name)
+        self._rows[name] = row
+        self._write(row, record)
+        start = self._n_group_ids
+        self._group_ids[start : start + len(groups)] = groups
+        self._n_group_ids += len(groups)
+        self._group_offsets[row + 1] = self._n_group_ids
+        self._size += 1
+        return row
+
+    def update(self, row: int, record: Mapping[str, Any] | Any):
+        """Overwrite row `row` with the fields of a `NebulaNode` or mapping, see `append`.
+
+        Raises:
+            ValueError: The record renames the row to the name of another row.
+        """
+        record = _fields(record)
+        name = str(record["name"])
+        if name != self.names[row]:
+            if name in self._rows:
+                raise ValueError(f"Node {name} already exists in the table")
+            del self._rows[self.names[row]]
+            self._rows[name] = row
+            self.names[row] = name
+        self._write(row, record)
+        groups = [self._intern(self._group_index, self.groups, g) for g in record.get("groups") or ()]
+        start, end = self._group_offsets[row], self._group_offsets[row + 1]
+        if self._group_ids[start:end].tolist() != groups:
+            self._set_groups(row, groups)
+
+    def _write(self, row: int, record: Mapping[str, Any]):
+        """Store the scalar fields of `record` (all but `name` and `groups`) in row `row`."""
+        self._changes += 1
+        ip = record.get("ip")
+        if ip is None:
+            self._has_ip[row] = False
+        else:
+            self._set_ip(row, ip)
+        self._port[row] = record.get("port", 4242)
+        self._flags[row] = (LIGHTHOUSE if record.get("am_lighthouse") else 0) | (
+            RELAY if record.get("am_relay") else 0
+        )
+        pool = record.get("pool")
+        self._pool[row] = -1 if pool is None else self._intern(self._pool_index, self.pools, pool)
+        public = record.get("public")
+        if public is None:
+            self.public.pop(row, None)
+            return
+        if isinstance(public, str):
+            host, port = public.rsplit(":", 1)
+            public = {"ip": host.strip("[]"), "port": int(port)}
+        if isinstance(public, Mapping):
+            public = _config.RoutableIPPort(**public)
+        self.public[row] = public
+
+    def _set_groups(self, row: int, groups: List[int]):
+        """Replace the group ids of row `row`, shifting the memberships of the rows after it."""
+        start, end = int(self._group_offsets[row]), int(self._group_offsets[row + 1])
+        ids = self._group_ids[: self._n_group_ids]
+        self._group_ids = np.concatenate([ids[:start], np.array(groups, dtype=np.int32), ids[end:]])
+        self._n_group_ids = len(self._group_ids)
+        self._group_offsets[row + 1 : self._size + 1] += len(groups) - (end - start)
+
+    @staticmethod
+    def _intern(ids: Dict[str, int], vocabulary: List[str], value: str) -> int:
+        if value not in ids:
+            ids[value] = len(vocabulary)
+            vocabulary.append(value)
+        return ids[value]
+
+    def _set_ip(self, row: int, ip):
+        ip = ipaddress.ip_address(ip)
+        if ip.version != self.version:
+            raise ValueError(f"IP {ip} is not an IPv{self.version} address")
+        if self.version == 4:
+            self._ip[row] = int(ip)
+        else:
+            self._ip[row] = (int(ip) >> 64, int(ip) & (2**64 - 1))
+        self._has_ip[row] = True
+        self._changes += 1
+
+    def address_ints(self, rows) -> List[int]:
+        """Integer IP addresses of `rows`, which must all have an IP."""
+        if self.version == 4:
+            return self._ip[rows].tolist()
+        return [(hi << 64) | lo for hi, lo in self._ip[rows].tolist()]
+
+    def address_int(self, row: int) -> int | None:
+        """Integer IP address of row `row` or None."""
+        if not self._has_ip[row]:
+            return None
+        if self.version == 4:
+            return int(self._ip[row])
+        hi, lo = self._ip[row]
+        return (int(hi) << 64) | int(lo)
+
+    def address(self, row: int):
+        """IP address of row `row` or None."""
+        if not self._has_ip[row]:
+            return None
+        if self.version == 4:
+            return ipaddress.IPv4Address(int(self._ip[row]))
+        hi, lo = self._ip[row]
+        return ipaddress.IPv6Address((int(hi) << 64) | int(lo))
+
+    def group_names(self, row: int) -> List[str]:
+        """Firewall group names of row `row`."""
+        ids = self._group_ids[self._group_offsets[row] : self._group_offsets[row + 1]]
+        return [self.groups[i] for i in ids.tolist()]
+
+    def node(self, row: int):
+        """Materialize row `row` as an unvalidated `NebulaNode`.
+
+        The view is a copy, changes to it are not written back to the table.
+        """
+        from .entities import NebulaNode
+
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError(f"Row {row} is out of range")
+        flags = int(self._flags[row])
+        pool = int(self._pool[row])
+        return NebulaNode.model_construct(
+            name=self.names[row],
+            ip=self.address(row),
+            port=int(self._port[row]),
+            am_lighthouse=bool(flags & LIGHTHOUSE),
+            am_relay=bool(flags & RELAY),
+            public=self.public.get(row),
+            groups=self.group_names(row),
+            pool=None if pool < 0 else self.pools[pool],
+        )
+
+    def nodes(self, rows: Iterable[int] | None = None) -> List:
+        """`NebulaNode` views of `rows` (default is None for every row)."""
+        if rows is None:
+            rows = range(self._size)
+        return [self.node(int(r)) for r in rows]
+
+    def assign_ips(self, network, pools: Mapping | None = None) -> np.ndarray:
+        """Assign the lowest free addresses of `network` to every row without an IP in one vectorized step.
+
+        Args:
+            network (str | ipaddress.IPv4Network | ipaddress.IPv6Network): Network to allocate from.
+            pools (Mapping | None): Named sub-ranges of `network` for rows with a `pool` (see `ipam.PoolSet`).
+
+        Raises:
+            ValueError: The network (or a pool) has too few free addresses.
+
+        Returns:
+            numpy.ndarray: Rows that were assigned an address.
+        """
+        n = self._size
+        has_ip = self._has_ip[:n]
+        if self.version == 4:
+            taken = self._ip[:n][has_ip].tolist()
+        else:
+            taken = [(hi << 64) | lo for hi, lo in self._ip[:n][has_ip].tolist()]
+        free = _ipam.PoolSet(network, pools, taken=taken)
+        missing = np.flatnonzero(~has_ip)
+        pool_of_row = self._pool[:n][missing]
+        for pool in np.unique(pool_of_row).tolist():
+            rows = missing[pool_of_row == pool]
+            name = None if pool < 0 else self.pools[pool]
+            self._ip[rows] = free.get(name).allocate_array(len(rows))
+        self._has_ip[missing] = True
+        self._changes += 1
+        return missing
+
+    def select(
+        self,
+        subnet=None,
+        group: str | None = None,
+        flags: int | None = None,
+    ) -> np.ndarray:
+        """Rows matching all given criteria, computed with vectorized masks.
+
+        Args:
+            subnet (str | ipaddress.IPv4Network | ipaddress.IPv6Network | None): Range the row IPs are within.
+            group (str | None): Firewall group the rows belong to.
+            flags (int | None): Role flag bits (`LIGHTHOUSE`, `RELAY`) the rows all have.
+
+        Returns:
+            numpy.ndarray: Matching rows in ascending order.
+        """
+        n = self._size
+        mask = np.ones(n, dtype=bool)
+        if subnet is not None:
+            subnet = ipaddress.ip_network(subnet)
+            low, high = int(subnet.network_address), int(subnet.broadcast_address)
+            mask &= self._has_ip[:n]
+            if self.version == 4:
+                mask &= (self._ip[:n] >= low) & (self._ip[:n] <= high)
+            else:
+                hi, lo = self._ip[:n, 0], self._ip[:n, 1]
+                mask &= _ge(hi, lo, low) & _le(hi, lo, high)
+        if group is not None:
+            in_group = np.zeros(n, dtype=bool)
+            if group in self._group_index:
+                ids = self._group_ids[: self._n_group_ids]
+                members = np.flatnonzero(ids == self._group_index[group])
+                rows = np.searchsorted(self._group_offsets[: n + 1], members, side="right") - 1
+                in_group[rows] = True
+            mask &= in_group
+        if flags is not None:
+            mask &= (self._flags[:n] & flags) == flags
+        return np.flatnonzero(mask)
+
+
+def _ge(hi, lo, value: int):
+    vhi, vlo = np.uint64(value >> 64), np.uint64(value & (2**64 - 1))
+    return (hi > vhi) | ((hi == vhi) & (lo >= vlo))
+
+
+def _le(hi, lo, value: int):
+    vhi, vlo = np.uint64(value >> 64), np.uint64(value & (2**64 - 1))
+    return (hi < vhi) | ((hi == vhi) & (lo <= vlo))
+
+
+def _fields(record: Mapping[str, Any] | Any) -> Mapping[str, Any]:
+    """Fields of a node mapping, or of a `NebulaNode` with its groups reduced to names."""
+    if isinstance(record, Mapping):
+        return record
+    fields = dict(record)
+    fields["groups"] = record.group_names()
+    return fields
+
+
+class TableNodes(MutableSequence):
+    """`NebulaNode` sequence backed by rows of a `NodeTable`, the `nodes` of `NebulaNetwork.from_table` networks.
+
+    Nodes are materialized on first access and kept, so that they can be changed in place like the nodes of a
+    list (call `NebulaNetwork.reindex` afterwards to write the changes back to the table). Lookups by name, IP,
+    group and role are answered from the table columns without materializing any other node.
+
+    Args:
+        table (NodeTable): Node table, shared with the caller.
+        rows (Iterable[int] | None): Rows of the nodes in order (default is None for every row).
+    """
+
+    def __init__(self, table: NodeTable, rows: Iterable[int] | None = None):
+        self.table = table
+        if rows is None:
+            rows = np.arange(len(table), dtype=np.int64)
+        order = np.array(rows if isinstance(rows, np.ndarray) else list(rows), dtype=np.int64).ravel()
+        if len(order) and (order.min() < 0 or order.max() >= len(table)):
+            raise ValueError(f"Rows of the network nodes must be within the {len(table)} table rows")
+        if len(order) and np.bincount(order).max() > 1:
+            raise ValueError("Rows of the network nodes must be unique")
+        # Row order with spare capacity at the end. Removed nodes are marked -1 in place and compacted away
+        # on the next access that needs the order, so removals cost O(1)
+        self._buffer = order
+        self._size = len(order)
+        self._removed = 0
+        self._positions = self._index_positions(order)
+        self._nodes: Dict[int, Any] = {}
+        # Table row by integer IP, built on the first IP lookup and kept current by the changes made here
+        self._ips: Dict[int, int] | None = None
+        self._ips_at = -1
+
+    @property
+    def _order(self) -> np.ndarray:
+        """Table rows of the nodes in order, without the removed ones."""
+        if self._removed:
+            self._compact()
+        return self._buffer[: self._size]
+
+    def _compact(self):
+        """Drop the removed nodes from the row order."""
+        order = self._buffer[: self._size]
+        order = order[order >= 0]
+        self._buffer, self._size, self._removed = order, len(order), 0
+        self._positions = self._index_positions(order)
+
+    def _index_positions(self, order: np.ndarray) -> np.ndarray:
+        """Index into the row order of every table row, -1 for the rows that are not nodes."""
+        positions = np.full(len(self.table), -1, dtype=np.int64)
+        positions[order] = np.arange(len(order))
+        return positions
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Table rows of the nodes, in node order."""
+        return self._order
+
+    def __len__(self) -> int:
+        return self._size - self._removed
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.node(r) for r in self._order[i].tolist()]
+        return self.node(int(self._order[i]))
+
+    def __iter__(self):
+        for row in self._order.tolist():
+            yield self.node(row)
+
+    def __setitem__(self, i, node):
+        row = int(self._order[i])
+        old = self.table.address_int(row)
+        synced = self._ips_synced()
+        self.table.update(row, node)
+        self._nodes[row] = node
+        if synced:
+            self._move_ip(row, old)
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            for row in self._order[i].tolist():
+                self.discard(row)
+            return
+        self.discard(int(self._order[i]))
+
+    def discard(self, row: int):
+        """Remove the node of table row `row`, in O(1).
+
+        Raises:
+            KeyError: The row is not one of the nodes.
+        """
+        if not self._has(row):
+            raise KeyError(row)
+        old = self.table.address_int(row)
+        self._buffer[self._positions[row]] = -1
+        self._positions[row] = -1
+        self._removed += 1
+        self._nodes.pop(row, None)
+        if self._ips is not None and old is not None and self._ips.get(old) == row:
+            del self._ips[old]
+
+    def insert(self, i, node):
+        self.extend([node], at=i)
+
+    def extend(self, nodes, at: int | None = None):
+        """Add `nodes` at position `at` (default is None for the end), in one update of the row order.
+
+        Raises:
+            ValueError: A node with the same name is already in the sequence.
+        """
+        synced = self._ips_synced()
+        rows, olds = [], []
+        for node in nodes:
+            row = self.table._rows.get(node.name)
+            if row is None:
+                old = None
+                row = self.table.append(node)
+            elif self._has(row) or row in rows:
+                raise ValueError(f"Node {node.name} already exists in the network")
+            else:
+                # Row of a removed node, reused for a node with the same name
+                old = self.table.address_int(row)
+                self.table.update(row, node)
+            self._nodes[row] = node
+            rows.append(row)
+            olds.append(old)
+        rows = np.array(rows, dtype=np.int64)
+        if len(self._positions) < len(self.table):
+            grown = np.full(max(len(self.table), 2 * len(self._positions)), -1, dtype=np.int64)
+            grown[: len(self._positions)] = self._positions
+            self._positions = grown
+        if at is None or at >= len(self):
+            end = self._size + len(rows)
+            if end > len(self._buffer):
+                buffer = np.empty(max(end, 2 * len(self._buffer), 1024), dtype=np.int64)
+                buffer[: self._size] = self._buffer[: self._size]
+                self._buffer = buffer
+            self._buffer[self._size : end] = rows
+            self._positions[rows] = np.arange(self._size, end)
+            self._size = end
+        else:
+            order = np.insert(self._order, at, rows)
+            self._buffer, self._size = order, len(order)
+            self._positions = self._index_positions(order)
+        if synced:
+            for row, old in zip(rows.tolist(), olds):
+                self._move_ip(row, old)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"TableNodes({len(self)} of {len(self.table)} rows)"
+
+    def node(self, row: int):
+        """Node of table row `row`, materialized on first access."""
+        node = self._nodes.get(row)
+        if node is None:
+            node = self._nodes[row] = self.table.node(row)
+        return node
+
+    def snapshot(self) -> List:
+        """Nodes in order, without keeping the ones that were not materialized yet."""
+        nodes, table = self._nodes, self.table
+        return [nodes[row] if row in nodes else table.node(row) for row in self._order.tolist()]
+
+    def _has(self, row: int) -> bool:
+        """True if table row `row` is one of the nodes."""
+        return row < len(self._positions) and self._positions[row] >= 0
+
+    def position(self, row: int) -> int | None:
+        """Position of table row `row` in the sequence, or None if it is not part of it."""
+        if not self._has(row):
+            return None
+        if self._removed:
+            self._compact()
+        return int(self._positions[row])
+
+    def order_key(self, row: int) -> int | None:
+        """Key that sorts table row `row` in node order without compacting removed nodes, or None if it is not
+        part of the sequence."""
+        return int(self._positions[row]) if self._has(row) else None
+
+    def row_of(self, name: str) -> int | None:
+        """Table row of the node named `name`, or None if it is not part of the sequence."""
+        row = self.table._rows.get(name)
+        if row is None or not self._has(row):
+            return None
+        return row
+
+    def row_of_ip(self, addr: int) -> int | None:
+        """Table row of the node with integer IP address `addr`, or None, from an index built on first use."""
+        if not self._ips_synced():
+            rows = self._order[self.table._has_ip[self._order]]
+            # Reversed so that the first node wins if several share the address
+            self._ips = dict(zip(self.table.address_ints(rows[::-1]), rows[::-1].tolist()))
+            self._ips_at = self.table._changes
+        return self._ips.get(addr)
+
+    def _ips_synced(self) -> bool:
+        """True if the IP index reflects every write to the IP column of the table."""
+        return self._ips is not None and self._ips_at == self.table._changes
+
+    def _move_ip(self, row: int, old: int | None):
+        """Update the current IP index after row `row` changed from integer IP `old`."""
+        if old is not None and self._ips.get(old) == row:
+            del self._ips[old]
+        new = self.table.address_int(row)
+        if new is not None:
+            self._ips.setdefault(new, row)
+        self._ips_at = self.table._changes
+
+    def names(self) -> Iterator[str]:
+        """Node names, in node order."""
+        names = self.table.names
+        return (names[r] for r in self._order.tolist())
+
+    def select(self, subnet=None, group: str | None = None, flags: int | None = None) -> np.ndarray:
+        """Rows of the nodes matching all given criteria (see `NodeTable.select`), in node order."""
+        if subnet is not None and ipaddress.ip_network(subnet).version != self.table.version:
+            return np.zeros(0, dtype=np.int64)
+        selected = np.zeros(len(self.table), dtype=bool)
+        selected[self.table.select(subnet=subnet, group=group, flags=flags)] = True
+        return self._order[selected[self._order]]
+
+    def sync(self):
+        """Write the fields of the materialized nodes back to the table."""
+        for row, node in self._nodes.items():
+            self.table.update(row, node)
+
+    def addresses(self) -> List[int]:
+        """Integer IP addresses of the nodes that have one."""
+        rows = self._order[self.table._has_ip[self._order]]
+        return self.table.address_ints(rows)
+
+    def assignments(self) -> Iterator[Tuple[str, Any]]:
+        """Name and IP address of every node that has an IP, in node order."""
+        for row in self._order[self.table._has_ip[self._order]].tolist():
+            yield self.table.names[row], self.table.address(row)
+
+    def unassigned(self) -> Dict[str, int]:
+        """Rows of the nodes without an IP, by node name."""
+        names = self.table.names
+        return {names[r]: r for r in self._order[~self.table._has_ip[self._order]].tolist()}
+
+    def set_address(self, row: int, addr):
+        """Assign `addr` to row `row` and to its node if it was materialized."""
+        old = self.table.address_int(row)
+        synced = self._ips_synced()
+        self.table._set_ip(row, addr)
+        if synced:
+            self._move_ip(row, old)
+        if row in self._nodes:
+            self._nodes[row].ip = self.table.address(row)
+
+    def allocate(self, pools: _ipam.PoolSet, hashed: bool = False):
+        """Assign free addresses of their pools to the nodes without an IP, one vectorized step per pool.
+
+        Args:
+            pools (ipam.PoolSet): Free addresses of the network.
+            hashed (bool): Place addresses by node name hash (see `ipam.PoolSet.allocate`) instead of taking the
+                lowest free addresses in node order (default is False).
+
+        Raises:
+            ValueError: A pool does not exist or has too few free addresses. No node is assigned an address.
+        """
+        table = self.table
+        missing = self._order[~table._has_ip[self._order]]
+        pool_of_row = table._pool[missing]
+        assigned = []
+        try:
+            for pool in dict.fromkeys(pool_of_row.tolist()):
+                rows = missing[pool_of_row == pool]
+                name = None if pool < 0 else table.pools[pool]
+                if hashed:
+                    addrs = pools.allocate(name, [table.names[r] for r in rows.tolist()], hashed=True)
+                    for row, addr in zip(rows.tolist(), addrs):
+                        table._set_ip(row, addr)
+                else:
+                    table._ip[rows] = pools.get(name).allocate_array(len(rows))
+                    table._has_ip[rows] = True
+                assigned.append(rows)
+        except ValueError:
+            for rows in assigned:
+                table._has_ip[rows] = False
+            raise
+        finally:
+            table._changes += 1
+        for row in missing.tolist():
+            if row in self._nodes:
+                self._nodes[row].ip = table.address(row)
+
+    def check(self, network, pools: Mapping[str, Any]) -> List[str]:
+        """Shared node IPs, node IPs that are not hosts of `network` and pool errors, vectorized.
+
+        Node names are unique by construction of the table.
+
+        Args:
+            network (ipaddress.IPv4Network | ipaddress.IPv6Network): Network of the nodes.
+            pools (Mapping[str, ipaddress.IPv4Network | ipaddress.IPv6Network]): Sub-ranges of `network`.
+
+        Returns:
+            list[str]: Error messages in the format of `NebulaNetwork` validation.
+        """
+        table = self.table
+        if network.version != table.version:
+            return [f"IPv{table.version} node table does not fit IPv{network.version} network {network}"]
+        errors = []
+        names = table.names
+        rows = self._order[table._has_ip[self._order]]
+        ips = table._ip[rows]
+        keys = ips if table.version == 4 else ips.view([("hi", np.uint64), ("lo", np.uint64)]).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        for shared in np.flatnonzero(counts > 1).tolist():
+            group = rows[inverse.ravel() == shared].tolist()
+            errors.append(
+                f"IP {table.address(group[0])} is shared by nodes {', '.join(names[r] for r in group)}"
+            )
+        first, last = _ipam.host_bounds(network)
+        outside = ~_within(table, ips, first, last)
+        for row in rows[outside].tolist():
+            errors.append(f"IP {table.address(row)} of node {names[row]} is not a host of {network}")
+        pool_of_row = table._pool[self._order]
+        for pool in np.unique(pool_of_row[pool_of_row >= 0]).tolist():
+            name = table.pools[pool]
+            members = self._order[pool_of_row == pool]
+            if name not in pools:
+                errors.extend(f"pool {name} of node {names[r]} does not exist" for r in members.tolist())
+                continue
+            subnet = ipaddress.ip_network(pools[name])
+            members = members[table._has_ip[members]]
+            inside = _within(
+                table, table._ip[members], int(subnet.network_address), int(subnet.broadcast_address)
+            )
+            for row in members[~inside].tolist():
+                errors.append(f"IP {table.address(row)} of node {names[row]} is outside of pool {name}")
+        return errors
+
+    def index(self) -> Dict[str, Any]:
+        """Lookup views standing in for the `NebulaNetwork` node indexes."""
+        return {
+            "name": _NameIndex(self),
+            "ip": _IPIndex(self),
+            "group": _GroupIndex(self),
+            "role": {"lighthouse": _RowsIndex(self, flags=LIGHTHOUSE), "relay": _RowsIndex(self, flags=RELAY)},
+            "order": _OrderIndex(self),
+        }
+
+
+def _within(table: NodeTable, ips: np.ndarray, low: int, high: int) -> np.ndarray:
+    """Mask of the `ips` column values within the integer range `[low, high]`."""
+    if table.version == 4:
+        return (ips >= low) & (ips <= high)
+    return _ge(ips[:, 0], ips[:, 1], low) & _le(ips[:, 0], ips[:, 1], high)
+
+
+class _NameIndex(Mapping):
+    """Nodes of a `TableNodes` by name."""
+
+    def __init__(self, nodes: TableNodes):
+        self._nodes = nodes
+
+    def __getitem__(self, name):
+        row = self._nodes.row_of(name)
+        if row is None:
+            raise KeyError(name)
+        return self._nodes.node(row)
+
+    def __contains__(self, name) -> bool:
+        return self._nodes.row_of(name) is not None
+
+    def __iter__(self):
+        return self._nodes.names()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+class _OrderIndex(_NameIndex):
+    """Keys sorting the nodes of a `TableNodes` in node order, by name."""
+
+    def __getitem__(self, name):
+        row = self._nodes.row_of(name)
+        if row is None:
+            raise KeyError(name)
+        return self._nodes.order_key(row)
+
+
+class _IPIndex(Mapping):
+    """Nodes of a `TableNodes` by IP address."""
+
+    def __init__(self, nodes: TableNodes):
+        self._nodes = nodes
+
+    def __getitem__(self, ip):
+        if ip is None or ip.version != self._nodes.table.version:
+            raise KeyError(ip)
+        row = self._nodes.row_of_ip(int(ip))
+        if row is None:
+            raise KeyError(ip)
+        return self._nodes.node(row)
+
+    def __iter__(self):
+        return (ip for _, ip in self._nodes.assignments())
+
+    def __len__(self) -> int:
+        return len(self._nodes.addresses())
+
+
+class _RowsIndex(Mapping):
+    """Nodes of a `TableNodes` in a firewall group or with role flags, by name."""
+
+    def __init__(self, nodes: TableNodes, group: str | None = None, flags: int | None = None):
+        self._nodes = nodes
+        self._group = group
+        self._flags = flags
+
+    def _rows(self) -> np.ndarray:
+        return self._nodes.select(group=self._group, flags=self._flags)
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self._nodes.node(self._nodes.row_of(name))
+
+    def __contains__(self, name) -> bool:
+        row = self._nodes.row_of(name)
+        if row is None:
+            return False
+        table = self._nodes.table
+        if self._flags is not None and int(table._flags[row]) & self._flags != self._flags:
+            return False
+        return self._group is None or self._group in table.group_names(row)
+
+    def __iter__(self):
+        names = self._nodes.table.names
+        return (names[r] for r in self._rows().tolist())
+
+    def __len__(self) -> int:
+        return len(self._rows())
+
+    def values(self):
+        return [self._nodes.node(r) for r in self._rows().tolist()]
+
+
+class _GroupIndex(Mapping):
+    """`_RowsIndex` of every firewall group of a `TableNodes`, by group name."""
+
+    def __init__(self, nodes: TableNodes):
+        self._nodes = nodes
+
+    def __getitem__(self, group):
+        if group not in self._nodes.table._group_index:
+            raise KeyError(group)
+        return _RowsIndex(self._nodes, group=group)
+
+    def __iter__(self):
+        return iter(self._nodes.table.groups)
+
+    def __len__(self) -> int:
+        return len(self._nodes.table.groups)
@@ -1,8 +1,19 @@
-from . import entities
+import asyncio
+import ipaddress
+import json
+import os
+import subprocess
+import tarfile
+import time
+from io import BytesIO
+
+import pytest
+
+from . import backends, config, entities, inventory, ipam, pki, query, table
 
 catest = "Test Authority"
 networkip = "10.100.100.0"
-neworkcidr = 24
+networkcidr = 24
 
 
 def test_NebulaNetwork_nonodes():
@@ -39,7 +50,836 @@ def test_NebulaNetwork():
     )
     print(testnet)
     print(testnet.network)
-    assert nodes[0].ip > nodes[1].ip
-    assert not (nodes[0].ip < nodes[1].ip)
+    assert nodes[0].ip < nodes[1].ip
+    assert not (nodes[0].ip > nodes[1].ip)
     print([n for n in sorted([_.ip for _ in nodes])])
     print(testnet.lighthouses)
+
+
+def test_AddressPool():
+    pool = ipam.AddressPool("10.0.0.0/8", taken=["10.100.0.1", "10.100.0.3"])
+    assert pool.intervals() == [
+        (int(ipaddress.ip_address("10.0.0.1")), int(ipaddress.ip_address("10.100.0.0"))),
+        (int(ipaddress.ip_address("10.100.0.2")), int(ipaddress.ip_address("10.100.0.2"))),
+        (int(ipaddress.ip_address("10.100.0.4")), int(ipaddress.ip_address("10.255.255.254"))),
+    ]
+    assert pool.allocate() == ipaddress.ip_address("10.0.0.1")
+    assert not pool.reserve("10.100.0.1")
+    assert pool.release("10.100.0.1")
+    assert "10.100.0.1" in pool
+    assert len(pool) == 2**24 - 4
+
+
+def test_NebulaNetwork_large():
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in range(3)]
+    nodes.append(entities.NebulaNode(name="fixed", ip="10.0.0.2"))
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.0.0.0", cidr=8, nodes=nodes
+    )
+    assert [str(n.ip) for n in testnet.nodes] == [
+        "10.0.0.1",
+        "10.0.0.3",
+        "10.0.0.4",
+        "10.0.0.2",
+    ]
+
+
+def test_NebulaNetwork_ledger(tmp_path):
+    ledger = str(tmp_path / "ledger.yaml")
+    names = ["a", "b", "c"]
+    first = entities.NebulaNetwork(
+        cert_authority=catest,
+        ip=networkip,
+        cidr=networkcidr,
+        nodes=[entities.NebulaNode(name=n) for n in names],
+        ledger=ledger,
+    )
+    ips = dict((n.name, n.ip) for n in first.nodes)
+    second = entities.NebulaNetwork(
+        cert_authority=catest,
+        ip=networkip,
+        cidr=networkcidr,
+        nodes=[entities.NebulaNode(name=n) for n in ["new", "c", "a"]],
+        ledger=ledger,
+    )
+    assert dict((n.name, n.ip) for n in second.nodes if n.name in ips) == {
+        "a": ips["a"],
+        "c": ips["c"],
+    }
+    # The address of the absent node "b" stays reserved
+    assert second.nodes[0].ip not in ips.values()
+    # Changes are appended to the ledger file, which is compacted when it is loaded again
+    size = os.path.getsize(ledger)
+    second.add_node({"name": "d"})
+    second.remove_node("new")
+    with open(ledger) as f:
+        assert f.read()[size:] == "d: 10.100.100.5\nnew: null\n"
+    reloaded = ipam.AddressLedger(ledger)
+    assert dict(reloaded) == {"a": str(ips["a"]), "b": str(ips["b"]), "c": str(ips["c"]), "d": "10.100.100.5"}
+    with open(ledger) as f:
+        assert len(f.readlines()) == 4
+
+
+def test_NebulaNetwork_add_remove():
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest,
+        ip=networkip,
+        cidr=networkcidr,
+        nodes=[entities.NebulaNode(name="a"), entities.NebulaNode(name="b")],
+    )
+    c = testnet.add_node({"name": "c"})
+    assert str(c.ip) == "10.100.100.3"
+    testnet.remove_node("a")
+    assert [n.name for n in testnet.nodes] == ["b", "c"]
+    d, e = testnet.add_nodes(
+        [entities.NebulaNode(name="d"), entities.NebulaNode(name="e", ip="10.100.100.9")]
+    )
+    assert str(d.ip) == "10.100.100.1"
+    try:
+        testnet.add_node(entities.NebulaNode(name="f", ip="10.100.100.9"))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Duplicate IP was accepted")
+    assert len(testnet.nodes) == 4
+    # An address kept by remove_node(release=False) goes back to the node with the same name only
+    testnet.remove_node("c", release=False)
+    assert str(testnet.add_node({"name": "f"}).ip) == "10.100.100.4"
+    assert str(testnet.add_node({"name": "c"}).ip) == "10.100.100.3"
+    testnet.remove_node("d", release=False)
+    assert str(testnet.add_node({"name": "d", "ip": "10.100.100.1"}).ip) == "10.100.100.1"
+
+
+def test_AddressPool_bulk():
+    pool = ipam.AddressPool("10.0.0.0/8", taken=["10.0.0.2", "10.0.0.4"])
+    addrs = pool.allocate_array(100000)
+    assert addrs.dtype.name == "uint32"
+    assert [str(ipaddress.ip_address(int(a))) for a in addrs[:3]] == [
+        "10.0.0.1",
+        "10.0.0.3",
+        "10.0.0.5",
+    ]
+    assert len(set(addrs.tolist())) == 100000
+    pool6 = ipam.AddressPool("fd00::/64")
+    hi, lo = pool6.allocate_array(2)[1]
+    assert ipaddress.ip_address((int(hi) << 64) | int(lo)) == ipaddress.ip_address(
+        "fd00::2"
+    )
+
+
+def test_NebulaNetwork_IPv6():
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest,
+        ip="fd00:100::",
+        cidr=64,
+        nodes=[entities.NebulaNode(name="a"), entities.NebulaNode(name="b", ip="fd00:100::1")],
+    )
+    assert str(testnet.nodes[0].ip) == "fd00:100::2"
+    assert str(testnet.add_node({"name": "c"}).ip) == "fd00:100::3"
+    assert testnet._pools.get(None).free_count() == 2**64 - 4
+    with pytest.raises(OverflowError, match="free_count"):
+        len(testnet._pools.get(None))
+    assert config.NetworkIPRange(ip="fd00:100::", cidr=64).mask == 64
+    with pytest.raises(ValueError, match="too large for IPv4"):
+        config.NetworkIPRange(ip="10.100.100.0", cidr=64)
+
+
+def test_NebulaNetwork_conflicts():
+    nodes = [
+        entities.NebulaNode(name="a", ip="10.100.100.5"),
+        entities.NebulaNode(name="b", ip="10.100.101.5"),
+        entities.NebulaNode(name="c", ip="10.100.100.5"),
+        entities.NebulaNode(name="d"),
+    ]
+    try:
+        entities.NebulaNetwork(
+            cert_authority=catest, ip=networkip, cidr=networkcidr, nodes=nodes
+        )
+    except ValueError as e:
+        assert "shared by nodes a, c" in str(e)
+        assert "10.100.101.5 of node b" in str(e)
+    else:
+        raise AssertionError("Conflicting nodes were accepted")
+    assert ipam.find_conflicts("fd00::/64", ["fd00::1", None, "fd00::1", "10.0.0.1"]) == (
+        [[0, 2]],
+        [3],
+    )
+
+
+def test_NebulaNetwork_pools():
+    nodes = [
+        entities.NebulaNode(name="a", pool="dc2"),
+        entities.NebulaNode(name="b"),
+        entities.NebulaNode(name="c", pool="dc1"),
+        entities.NebulaNode(name="d", pool="dc2"),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest,
+        ip="10.100.0.0",
+        cidr=16,
+        nodes=nodes,
+        pools={"dc1": "10.100.0.0/22", "dc2": "10.100.4.0/22"},
+    )
+    assert [str(n.ip) for n in nodes] == [
+        "10.100.4.0",
+        "10.100.8.0",
+        "10.100.0.1",
+        "10.100.4.1",
+    ]
+    assert [str(r) for r in testnet.ranges([nodes[0], nodes[3]])] == ["10.100.4.0/22"]
+    assert str(testnet.add_node({"name": "e", "pool": "dc1"}).ip) == "10.100.0.2"
+
+
+def test_NebulaNetwork_hashed():
+    names = [f"node{i}" for i in range(50)]
+    nets = [
+        entities.NebulaNetwork(
+            cert_authority=catest,
+            ip=networkip,
+            cidr=networkcidr,
+            nodes=[entities.NebulaNode(name=n) for n in order],
+            allocation="hashed",
+        )
+        for order in (names, names[::-1])
+    ]
+    ips = [dict((n.name, n.ip) for n in net.nodes) for net in nets]
+    assert ips[0] == ips[1]
+    assert len(set(ips[0].values())) == len(names)
+
+
+def test_NebulaNetwork_renumber(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nodes = [
+        entities.NebulaNode(name="lh", ip="10.100.0.200", am_lighthouse=True),
+        entities.NebulaNode(name="a", ip="10.100.0.3"),
+        entities.NebulaNode(name="b", ip="10.100.3.9"),
+        entities.NebulaNode(name="c"),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=22, nodes=nodes
+    )
+    plan = testnet.plan_renumber("10.100.0.0", 24)
+    assert not plan.new_ca
+    assert dict((k, str(v)) for k, v in plan.moves.items()) == {"b": "10.100.0.2"}
+    assert plan.resign == ["lh", "a", "b", "c"]
+    assert plan.reconfigure == ["lh", "a", "b", "c"]
+    testnet.apply_renumber(plan)
+    assert str(testnet.network) == "10.100.0.0/24"
+    assert str(nodes[2].ip) == "10.100.0.2"
+    plan = testnet.plan_renumber("10.100.0.0", 24, pools={})
+    assert plan.moves == {} and plan.resign == [] and plan.reconfigure == []
+    plan = testnet.plan_renumber("10.200.0.0", 24)
+    assert plan.new_ca
+    assert sorted(plan.reconfigure) == ["a", "b", "c", "lh"]
+
+
+def test_NebulaNetwork_indexes():
+    nodes = [
+        entities.NebulaNode(name="lh", am_lighthouse=True, groups=["infra"]),
+        entities.NebulaNode(name="relay", am_relay=True, groups=["infra", "db"]),
+        entities.NebulaNode(name="db1", groups=["db"]),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip=networkip, cidr=networkcidr, nodes=nodes
+    )
+    assert testnet.get_nodes("db1") == [nodes[2]]
+    assert testnet.get_nodes("missing") == []
+    assert testnet.get_node_by_ip(nodes[1].ip) is nodes[1]
+    assert [n.name for n in testnet.get_nodes(group="db")] == ["relay", "db1"]
+    assert testnet.get_nodes(group="db", role="relay") == [nodes[1]]
+    assert testnet.lighthouses == [nodes[0]]
+    testnet.remove_node("relay")
+    assert testnet.get_nodes(group="db") == [nodes[2]]
+    testnet.add_node({"name": "lh2", "am_lighthouse": True})
+    assert [n.name for n in testnet.lighthouses] == ["lh", "lh2"]
+
+
+def test_NebulaNetwork_cache():
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip=networkip, cidr=networkcidr
+    )
+    assert testnet.temp is testnet.temp
+    assert testnet.network is testnet.network
+    prefix = testnet.temp.ca_cert_prefix
+    testnet.cidr = 25
+    assert str(testnet.network) == "10.100.100.0/25"
+    assert testnet.temp.ca_cert_prefix != prefix
+    assert testnet.lighthouses == []
+    lh = testnet.add_node({"name": "lh", "am_lighthouse": True})
+    assert testnet.lighthouses == [lh]
+
+
+def test_NebulaNetwork_query():
+    nodes = [
+        entities.NebulaNode(name="lh", ip="10.100.4.1", am_lighthouse=True, groups=["db"]),
+        entities.NebulaNode(name="db-1", ip="10.100.4.2", groups=["db"]),
+        entities.NebulaNode(name="db-2", ip="10.100.9.2", groups=["db"]),
+        entities.NebulaNode(name="web-1", ip="10.100.5.7", groups=["web"]),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes
+    )
+    q = "group:db and not role:lighthouse and in:10.100.4.0/22"
+    assert testnet.get_nodes(where=q) == [nodes[1]]
+    selector = query.Subnet("10.100.4.0/22") & (query.Name("web-*") | query.Role("lighthouse"))
+    assert testnet.get_nodes(where=selector) == [nodes[0], nodes[3]]
+    assert testnet.get_nodes(where="re:db-\\d | name:lh", group="db") == nodes[:3]
+    # Results follow the order of `nodes` after removals and additions
+    testnet.remove_node(nodes[0].name)
+    testnet.remove_node(nodes[1].name)
+    testnet.add_node({"name": "web-9"})
+    assert testnet.get_nodes(where="name:*") == testnet.nodes
+
+
+def test_NodeTable():
+    nodes = table.NodeTable.from_records(
+        {"name": f"node{i}", "groups": ["db"] if i % 2 else ["web"]} for i in range(5000)
+    )
+    nodes.append({"name": "lh", "ip": "10.0.0.1", "am_lighthouse": True, "public": "1.2.3.4:4242"})
+    nodes.assign_ips("10.0.0.0/8")
+    assert str(nodes[0].ip) == "10.0.0.2"
+    rows = nodes.select(subnet="10.0.0.0/29", group="db")
+    assert [nodes.names[r] for r in rows] == ["node1", "node3", "node5"]
+    lh = nodes[nodes.row("lh")]
+    assert lh.am_lighthouse and str(lh.public) == "1.2.3.4:4242"
+    testnet = entities.NebulaNetwork.from_table(
+        nodes,
+        nodes.select(flags=table.LIGHTHOUSE),
+        cert_authority=catest,
+        ip="10.0.0.0",
+        cidr=8,
+    )
+    assert testnet.lighthouses[0].name == "lh"
+    assert testnet.to_table().names == ["lh"]
+
+
+def test_NodeTable_network():
+    nodes = table.NodeTable.from_records(
+        {"name": f"node{i}", "groups": ["db"] if i % 2 else ["web"]} for i in range(5000)
+    )
+    nodes.append({"name": "lh", "ip": "10.0.0.1", "am_lighthouse": True, "public": "1.2.3.4:4242"})
+    testnet = entities.NebulaNetwork.from_table(nodes, cert_authority=catest, ip="10.0.0.0", cidr=8)
+    # Nothing is materialized by validation and allocation, and lookups only materialize their results
+    assert len(testnet.nodes) == 5001 and not testnet.nodes._nodes
+    assert str(nodes.address(0)) == "10.0.0.2"
+    assert testnet.get_node("node3").ip == nodes.address(3)
+    assert testnet.get_node_by_ip("10.0.0.2").name == "node0"
+    assert [n.name for n in testnet.lighthouses] == ["lh"]
+    assert [n.name for n in testnet.get_nodes(where="in:10.0.0.0/29 and group:db")] == ["node1", "node3", "node5"]
+    assert len(testnet.get_nodes(group="web", role="lighthouse")) == 0
+    assert len(testnet.nodes._nodes) == 5
+    # Dumps materialize the nodes without keeping them
+    assert testnet.model_dump()["nodes"][4]["groups"] == ["web"]
+    assert json.loads(testnet.model_dump_json())["nodes"][0]["ip"] == "10.0.0.2"
+    assert len(testnet.nodes._nodes) == 5
+    # Nodes are added to and removed from the table rows, changes in place are written back by reindex
+    testnet.remove_node("node0")
+    assert "node0" not in testnet._by_name and testnet.nodes[0].name == "node1"
+    with pytest.raises(KeyError):
+        testnet.get_node_by_ip("10.0.0.2")
+    nodes.update(nodes.row("node5"), {"name": "node5", "ip": "10.200.0.1", "groups": ["db"]})
+    assert testnet.get_node_by_ip("10.200.0.1").name == "node5"
+    nodes.update(nodes.row("node5"), {"name": "node5", "ip": "10.0.0.7", "groups": ["db"]})
+    assert str(testnet.add_node({"name": "new"}).ip) == "10.0.0.2"
+    assert str(testnet.add_node({"name": "node0", "groups": ["db"]}).ip) == "10.0.19.138"
+    assert testnet.get_nodes(where="name:node0 | name:new") == testnet.nodes[-2:]
+    testnet.get_node("node2").groups = ["db"]
+    testnet.reindex()
+    assert nodes.group_names(2) == ["db"] and "node2" in testnet._by_group["db"]
+    with pytest.raises(ValueError):
+        testnet.add_node({"name": "dup", "ip": "10.0.0.1"})
+    # Subsets of the rows are validated like node lists
+    subset = entities.NebulaNetwork.from_table(
+        nodes, nodes.select(group="db"), cert_authority=catest, ip="10.0.0.0", cidr=8
+    )
+    assert len(subset.nodes) == 2502 and subset.get_node("node1").ip == testnet.get_node("node1").ip
+    with pytest.raises(KeyError):
+        subset.get_node("node4")
+    with pytest.raises(ValueError):
+        entities.NebulaNetwork.from_table(nodes, cert_authority=catest, ip="10.0.0.0", cidr=24)
+    clash = table.NodeTable.from_records([{"name": "a", "ip": "10.0.0.5"}, {"name": "b", "ip": "10.0.0.5"}])
+    with pytest.raises(ValueError, match="shared by nodes a, b"):
+        entities.NebulaNetwork.from_table(clash, cert_authority=catest, ip="10.0.0.0", cidr=24)
+
+
+def test_trusted_inventory(tmp_path):
+    nodes = [
+        entities.NebulaNode(
+            name="lh", am_lighthouse=True, public=config.RoutableIPPort(ip="1.2.3.4", port=4242)
+        ),
+        entities.NebulaNode(name="db", groups=["db", config.InOutboundItem(group="web", port=5432)]),
+    ] + [entities.NebulaNode(name=f"node{i}") for i in range(100)]
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes)
+    path = str(tmp_path / "inventory.json")
+    checksum = testnet.dump_inventory(path)
+    trusted = entities.NebulaNetwork.load_inventory(path, checksum)
+    assert trusted.inventory() == testnet.inventory()
+    assert trusted.nodes[1] == testnet.nodes[1]
+    assert trusted.get_node("lh").public == testnet.get_node("lh").public
+    assert trusted.get_node_by_ip("10.100.0.3").name == "node0"
+    assert trusted.model_dump() == testnet.model_dump() and repr(trusted) == repr(testnet)
+    # Reformatted files are hashed after decoding them
+    with open(path, "wt") as f:
+        json.dump({"checksum": checksum, "network": testnet.inventory()}, f, indent=2)
+    assert entities.NebulaNetwork.load_inventory(path, checksum).nodes == testnet.nodes
+    # An edited inventory no longer matches its checksum and is validated again
+    inventory = testnet.inventory()
+    inventory["nodes"][2]["ip"] = "10.100.0.1"
+    with pytest.raises(ValueError):
+        entities.NebulaNetwork.from_trusted(inventory, entities.inventory_checksum(testnet.inventory()))
+    # The checksum stored in the file is never trusted, even when it matches an edited inventory
+    inventory["nodes"][3]["port"] = "not-a-port"
+    with open(path, "wt") as f:
+        json.dump({"checksum": entities.inventory_checksum(inventory), "network": inventory}, f)
+    with pytest.raises(ValueError):
+        entities.NebulaNetwork.load_inventory(path)
+    with pytest.raises(ValueError):
+        entities.NebulaNetwork.load_inventory(path, checksum)
+    with pytest.raises(ValueError):
+        entities.NebulaNode(name="bad", ip="10.100.0")
+
+
+def test_inventory_import(tmp_path):
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16)
+    csvfile = tmp_path / "hosts.csv"
+    csvfile.write_text(
+        "name,ip,am_lighthouse,public,groups\n"
+        "lh,10.100.0.1,true,1.2.3.4:4242,\n"
+        + "".join(f"node{i},,false,,web;db\n" for i in range(25))
+    )
+    assert inventory.import_nodes(testnet, inventory.read_csv(str(csvfile)), batch_size=10) == 26
+    assert str(testnet.get_node("lh").public) == "1.2.3.4:4242"
+    assert testnet.get_node("node0").groups == ["web", "db"]
+    jsonl = tmp_path / "hosts.jsonl"
+    jsonl.write_text('{"name": "j1", "port": 4243}\n\n{"name": "j2", "pool": null}\n')
+    assert inventory.import_nodes(testnet, inventory.read_jsonl(str(jsonl))) == 2
+    ini = tmp_path / "inventory.ini"
+    ini.write_text(
+        "[web]\nweb1 nebula_ip=10.100.1.1\nweb2\n\n"
+        "[lighthouses]\nlh2 ansible_host=5.6.7.8 nebula_public=5.6.7.8\n\n"
+        "[lighthouses:vars]\nnebula_am_lighthouse=true\n\n"
+        "[edge:children]\nweb\n\n"
+        "[all:vars]\nnebula_port=4300\nnebula_am_lighthouse=false\n"
+    )
+    inventory.import_nodes(testnet, inventory.read_ansible(str(ini)))
+    assert str(testnet.get_node("web1").ip) == "10.100.1.1"
+    assert testnet.get_node("web1").port == 4300 and not testnet.get_node("web1").am_lighthouse
+    assert testnet.get_node("web2").groups == ["web", "edge"]
+    assert testnet.get_node("lh2").am_lighthouse
+    assert str(testnet.get_node("lh2").public) == "5.6.7.8:4242"
+    yml = tmp_path / "inventory.yml"
+    yml.write_text(
+        "all:\n  children:\n    db:\n      hosts:\n        db1:\n          nebula_port: 4300\n"
+        "      vars:\n        nebula_am_relay: true\n"
+    )
+    inventory.import_nodes(testnet, inventory.read_ansible(str(yml)))
+    assert testnet.get_node("db1").am_relay and testnet.get_node("db1").port == 4300
+    assert testnet.get_node("db1").groups == ["db"]
+    with pytest.raises(ValueError):
+        inventory.import_nodes(testnet, [{"name": "bad", "ip": "not an ip"}])
+
+
+def test_shared_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nodes = [
+        entities.NebulaNode(
+            name="lh", am_lighthouse=True, public=config.RoutableIPPort(ip="1.2.3.4", port=4242)
+        ),
+        entities.NebulaNode(name="node1", groups=["web"]),
+        entities.NebulaNode(name="node2", groups=["web"]),
+        entities.NebulaNode(name="node3", port=4300),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes, backend=backends.RecordingBackend()
+    )
+    testnet.create_node_cert()
+    node1, node2, node3 = (testnet.get_node(f"node{i}").config for i in (1, 2, 3))
+    assert node1.tun is node2.tun is node3.tun
+    assert node1.firewall is node2.firewall and node1.static_host_map is node3.static_host_map
+    assert node1.listen is node2.listen and node3.listen.port == 4300
+    assert node1.pki is not node2.pki
+    with pytest.raises(ValueError):
+        node1.tun.mtu = 1400
+    node1.own("tun").mtu = 1400
+    assert node1.tun.mtu == 1400 and node2.tun.mtu == 1300
+    assert "mtu: 1400" in testnet.get_node("node1").dump_config()
+    # Lists and dicts of shared sections are frozen too
+    rule = config.InOutboundItem(group="db")
+    with pytest.raises(TypeError):
+        node1.firewall.outbound.append(rule)
+    with pytest.raises(TypeError):
+        node1.static_host_map.contents["10.100.0.9"] = []
+    node1.own("firewall").outbound.append(rule)
+    node1.own("static_host_map").contents.clear()
+    assert len(node2.firewall.outbound) == 1 and len(node3.static_host_map.contents) == 1
+    assert "group: db" in testnet.get_node("node1").dump_config()
+    assert "group: db" not in testnet.get_node("node2").dump_config()
+
+
+def test_lazy_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nodes = [
+        entities.NebulaNode(
+            name="lh", am_lighthouse=True, public=config.RoutableIPPort(ip="1.2.3.4", port=4242)
+        ),
+        entities.NebulaNode(name="node1"),
+        entities.NebulaNode(name="node2"),
+    ]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes, backend=backends.RecordingBackend()
+    )
+    testnet.create_node_cert(configs=False)
+    assert all(node.config is None for node in testnet.nodes)
+    node1 = testnet.node_config("node1")
+    assert node1 is testnet.node_config("node1")
+    assert str(node1.static_host_map.contents[ipaddress.ip_address("10.100.0.1")][0]) == "1.2.3.4:4242"
+    testnet.add_node(
+        entities.NebulaNode(
+            name="lh2", am_lighthouse=True, public=config.RoutableIPPort(ip="5.6.7.8", port=4242)
+        )
+    )
+    assert len(testnet.node_config("node1").static_host_map.contents) == 2
+    entities._io.make_temp_dir(testnet)
+    testnet.save_node_configs("node2")
+    assert (tmp_path / catest.replace(" ", "") / "node2.yaml").exists()
+    assert "node2" not in testnet._cache.get("configs", {})
+
+
+def test_sign_nodes_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    class Containers:
+        def run(self, command, **kwargs):
+            self.script = open(command[1]).read()
+            return b"ok\tnode1\nfail\tnode2\terror: boom\n"
+
+    client = type("Client", (), {"containers": Containers()})()
+    monkeypatch.setattr(entities._io, "dclient", client)
+    monkeypatch.setattr(entities._io, "network_cert", lambda network: None)
+    monkeypatch.setattr(entities._io, "nebula_cert_binary", lambda network: "/nebula-cert")
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in (1, 2, 3)]
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes)
+    entities._io.make_temp_dir(testnet)
+    for f in entities._io.node_outputs(testnet, nodes[2]):
+        open(f, "w").close()
+    results = testnet.create_node_cert(batch=True, raise_on_error=False)
+    assert [(r.name, r.ok, r.error) for r in results] == [
+        ("node1", True, None),
+        ("node2", False, "error: boom"),
+        ("node3", True, None),
+    ]
+    assert nodes[0].config is not None and nodes[1].config is None
+    script = client.containers.script
+    assert "run node1 sign -name node1" in script and "node3" not in script
+    assert not [f for f in os.listdir(testnet.temp.dir) if f.startswith("sign_batch")]
+
+
+def test_sign_nodes_batch_quoting(tmp_path, monkeypatch):
+    workdir = tmp_path / "work dir"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    nebula_cert = tmp_path / "nebula-cert"
+    nebula_cert.write_text(
+        '#!/bin/sh\nwhile [ $# -gt 0 ]; do case "$1" in -out-*) touch "$2";; esac; shift; done\n'
+    )
+    nebula_cert.chmod(0o755)
+
+    class Containers:
+        def run(self, command, **kwargs):
+            return subprocess.run(command, capture_output=True, check=True).stdout
+
+    client = type("Client", (), {"containers": Containers()})()
+    monkeypatch.setattr(entities._io, "dclient", client)
+    monkeypatch.setattr(entities._io, "network_cert", lambda network: None)
+    monkeypatch.setattr(entities._io, "nebula_cert_binary", lambda network: str(nebula_cert))
+    names = ["my node", "evil$(touch${IFS}pwned)", "evil`touch${IFS}pwned`"]
+    nodes = [entities.NebulaNode(name=name) for name in names]
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes)
+    results = testnet.create_node_cert(batch=True, configs=False)
+    assert [(r.name, r.ok) for r in results] == [(name, True) for name in names]
+    assert not (workdir / "pwned").exists()
+    assert all(entities._io.node_outputs(testnet, node, exist="all") for node in nodes)
+
+
+def test_nebula_cert_binary(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def archive(data):
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            info = tarfile.TarInfo("nebula-cert")
+            info.size = len(data)
+            tar.addfile(info, BytesIO(data))
+        return [buffer.getvalue()], None
+
+    class Client:
+        image_id = "sha256:" + "a" * 64
+        copies = 0
+
+        @property
+        def images(self):
+            return type("Images", (), {"get": lambda _, name: type("Image", (), {"id": self.image_id})})()
+
+        @property
+        def containers(self):
+            client = self
+
+            class Container:
+                def __init__(self, image):
+                    self.image = image
+
+                def get_archive(self, path):
+                    client.copies += 1
+                    return archive(self.image.encode())
+
+                def remove(self):
+                    pass
+
+            return type("Containers", (), {"create": lambda _, image: Container(image)})()
+
+    client = Client()
+    monkeypatch.setattr(entities._io, "dclient", client)
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16)
+    first = entities._io.nebula_cert_binary(testnet)
+    assert entities._io.nebula_cert_binary(testnet) == first and client.copies == 1
+    client.image_id = "sha256:" + "b" * 64
+    second = entities._io.nebula_cert_binary(testnet)
+    assert second != first and client.copies == 2 and not os.path.exists(first)
+    with open(second) as f:
+        assert f.read() == client.image_id
+
+
+def test_signing_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    class Container:
+        removed = False
+
+        def exec_run(self, cmd):
+            return (1, b"error: boom\n") if "node2" in cmd else (0, b"")
+
+        def remove(self, force=False):
+            self.removed = True
+
+    class Containers:
+        started = []
+
+        def run(self, **kwargs):
+            self.started.append(Container())
+            return self.started[-1]
+
+    client = type("Client", (), {"containers": Containers()})()
+    monkeypatch.setattr(entities._io, "dclient", client)
+    monkeypatch.setattr(entities._io, "network_cert", lambda network: None)
+    monkeypatch.setattr(entities._io, "nebula_cert_binary", lambda network: "/nebula-cert")
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in (1, 2)]
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes)
+    worker = entities._io.signing_worker(testnet, idle_timeout=0.05)
+    assert worker is entities._io.signing_worker(testnet, idle_timeout=0.05)
+    entities._io.sign_node(testnet, nodes[0], warm=True)
+    assert worker.sign(nodes[1]).error == "error: boom"
+    assert len(client.containers.started) == 1
+    time.sleep(0.2)
+    assert worker.container is None and client.containers.started[0].removed
+    worker.close()
+
+
+def test_sign_nodes_parallel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    class Containers:
+        names = []
+        running = 0
+        peak = 0
+
+        def run(self, name, command, **kwargs):
+            self.names.append(name)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            time.sleep(0.02)
+            self.running -= 1
+            if "node3" in command:
+                raise RuntimeError("boom")
+
+    client = type("Client", (), {"containers": Containers()})()
+    monkeypatch.setattr(entities._io, "dclient", client)
+    monkeypatch.setattr(entities._io, "network_cert", lambda network: None)
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in range(8)]
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes)
+    results = testnet.create_node_cert(workers=4, configs=False, raise_on_error=False)
+    assert [r.name for r in results] == [n.name for n in nodes]
+    assert [r.ok for r in results] == [True] * 3 + [False] + [True] * 4
+    assert 1 < client.containers.peak <= 4
+    assert len(set(client.containers.names)) == 8
+
+
+def test_async_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    class SlowBackend(backends.RecordingBackend):
+        def sign_node(self, network, node, overwrite=False):
+            time.sleep(0.05 if node.name == "node0" else 0)
+            super().sign_node(network, node, overwrite=overwrite)
+
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in range(4)]
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes, backend=SlowBackend(fail=["node2"])
+    )
+
+    async def run():
+        results = [r async for r in testnet.acreate_node_cert(concurrency=2)]
+        configs = [p async for p in testnet.asave_node_configs()]
+        composes = [p async for p in testnet.asave_node_composes("node1")]
+        return results, configs, composes
+
+    results, configs, composes = asyncio.run(run())
+    assert results[-1].name == "node0"
+    assert {r.name for r in results if not r.ok} == {"node2"}
+    assert nodes[2].config is None and nodes[1].config is not None
+    assert len(configs) == 4 and all(os.path.exists(p) for p in configs)
+    assert len(composes) == 1 and os.path.exists(composes[0])
+
+
+def test_pki_encoding():
+    details = {
+        "name": "node1",
+        "ips": [ipaddress.IPv4Interface("10.100.0.5/16")],
+        "groups": ["web", "db"],
+        "not_before": 1700000000,
+        "not_after": 1800000000,
+        "public_key": bytes(32),
+        "issuer": bytes(range(32)),
+    }
+    marshalled = pki.marshal_details(details)
+    # Name field, then the packed address and netmask pair
+    assert marshalled.startswith(b"\x0a\x05node1\x12\x09\x85\x80\x90\x53\x80\x80\xfc\xff\x0f")
+    decoded = pki.unmarshal_details(marshalled)
+    assert all(decoded[k] == v for k, v in details.items()) and not decoded["is_ca"]
+    pem = pki.pem_encode(pki.CERTIFICATE_BANNER, pki.marshal_certificate(marshalled, bytes(64)))
+    assert max(len(line) for line in pem.splitlines()) == 64
+    assert pki.read_certificate(pem)["groups"] == ["web", "db"]
+    with pytest.raises(ValueError):
+        pki.pem_decode(pem, pki.X25519_PUBLIC_KEY_BANNER)
+
+
+def test_pki_sign(tmp_path, monkeypatch):
+    pytest.importorskip("cryptography")
+    monkeypatch.chdir(tmp_path)
+    ca_crt, ca_key = pki.create_ca(catest, "10.100.0.0/16")
+    key, pub = pki.create_keypair()
+    crt = pki.sign(ca_crt, ca_key, "node1", "10.100.0.5/16", pub, groups=["web"])
+    assert pki.verify(crt, ca_crt)
+    assert not pki.verify(crt, pki.create_ca("Other")[0])
+    details = pki.read_certificate(crt)
+    assert details["not_after"] == pki.read_certificate(ca_crt)["not_after"] - 1
+    with pytest.raises(ValueError):
+        pki.sign(ca_crt, ca_key, "node2", "10.200.0.5/16", pub)
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=[entities.NebulaNode(name="node1")]
+    )
+    pki.sign_node(testnet, testnet.nodes[0])
+    node_crt, node_key = entities._io.node_outputs(testnet, testnet.nodes[0])
+    with open(node_crt) as f, open(entities._io.ca_outputs(testnet)[0]) as ca:
+        assert pki.verify(f.read(), ca.read())
+
+
+def test_backends(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nodes = [entities.NebulaNode(name=f"node{i}") for i in range(3)]
+    backend = backends.RecordingBackend(fail=["node1"])
+    testnet = entities.NebulaNetwork(
+        cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=nodes, backend=backend
+    )
+    assert "backend" not in testnet.model_dump() and "backend=" not in repr(testnet)
+    with pytest.raises(ValueError, match="1 node\\(s\\): node1"):
+        testnet.create_node_cert()
+    backend.calls.clear()
+    results = testnet.create_node_cert(raise_on_error=False)
+    assert [r.ok for r in results] == [True, False, True]
+    assert backend.calls == [("network_cert", catest.replace(" ", ""))] + [
+        ("sign_node", f"node{i}") for i in range(3)
+    ]
+    assert testnet.get_node("node0").config is not None and testnet.get_node("node1").config is None
+    with pytest.raises(ValueError, match="configure the backend"):
+        testnet.create_node_cert(batch=True)
+    nebula_cert = tmp_path / "nebula-cert"
+    nebula_cert.write_text(
+        '#!/bin/sh\nwhile [ $# -gt 0 ]; do case "$1" in -out-*) touch "$2";; esac; shift; done\n'
+    )
+    nebula_cert.chmod(0o755)
+    testnet.backend = backends.SubprocessBackend(str(nebula_cert))
+    assert all(r.ok for r in testnet.create_node_cert())
+    assert all(entities._io.node_outputs(testnet, node, exist="all") for node in nodes)
+    assert entities._io.ca_outputs(testnet, exist="all")
+    testnet.backend = backends.SubprocessBackend(str(nebula_cert), workers=2)
+    nodes[0].name, nodes[1].name = "node3", "fail"
+    nebula_cert.write_text(
+        '#!/bin/sh\ncase "$*" in *fail*) echo boom >&2; exit 1;; esac\n'
+        'while [ $# -gt 0 ]; do case "$1" in -out-*) touch "$2";; esac; shift; done\n'
+    )
+    with pytest.raises(ValueError, match="fail: .*boom"):
+        testnet.create_node_cert(configs=False)
+    results = testnet.create_node_cert(configs=False, raise_on_error=False)
+    assert [r.name for r in results] == ["node3", "fail", "node2"]
+    assert [r.ok for r in results] == [True, False, True] and "boom" in results[1].error
+    assert entities._io.node_outputs(testnet, nodes[0], exist="all")
+
+
+def test_subprocess_backend_quoting(tmp_path, monkeypatch):
+    workdir = tmp_path / "my dir"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    nebula_cert = tmp_path / "nebula-cert"
+    nebula_cert.write_text(
+        '#!/bin/sh\nwhile [ $# -gt 0 ]; do case "$1" in -out-*) touch "$2";; esac; shift; done\n'
+    )
+    nebula_cert.chmod(0o755)
+    testnet = entities.NebulaNetwork(
+        cert_authority="O'Reilly CA",
+        ip="10.100.0.0",
+        cidr=16,
+        nodes=[entities.NebulaNode(name="node0")],
+        backend=backends.SubprocessBackend(str(nebula_cert)),
+    )
+    assert all(r.ok for r in testnet.create_node_cert(configs=False))
+    assert entities._io.ca_outputs(testnet, exist="all")
+    assert not os.path.exists(tmp_path / "my")
+    qr = testnet.qr_code("node0")
+    assert os.path.exists(qr) and not os.path.exists(tmp_path / "my")
+    testnet.backend = backends.SubprocessBackend("true")
+    entities._io.ca_outputs(testnet, rm_exist=True)
+    with pytest.raises(ValueError, match="did not create"):
+        testnet.backend.network_cert(testnet)
+
+
+def test_qr_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    node = entities.NebulaNode(name="node0")
+    testnet = entities.NebulaNetwork(cert_authority=catest, ip="10.100.0.0", cidr=16, nodes=[node])
+    assert len(entities._io.node_outputs(testnet, node)) == 2 and len(entities._io.ca_outputs(testnet)) == 2
+    assert "-out-qr" not in entities._io.sign_command(testnet, node)
+    assert "-out-qr" not in entities._io.ca_command(testnet)
+    entities._io.make_temp_dir(testnet)
+    for f in entities._io.node_outputs(testnet, node):
+        open(f, "w").close()
+    assert entities._io.node_outputs(testnet, node, exist="all")
+    testnet.backend = backends.RecordingBackend()
+    qr = testnet.qr_code(node)
+    assert qr.endswith("node0.png") and testnet.backend.calls == [("qr_code", qr[:-3] + "crt")]
+    with pytest.raises(ValueError):
+        testnet.qr_code()
+    testnet.qr = True
+    assert entities._io.node_outputs(testnet, node)[2] == qr
+    assert entities._io.node_outputs(testnet, node, exist="all")
+    for f in entities._io.ca_outputs(testnet)[:2]:
+        open(f, "w").close()
+    backends.SubprocessBackend("false").network_cert(testnet)
+    assert backends.SubprocessBackend._pending(testnet, node, overwrite=False) is None
+    assert f"-out-qr {qr}" in entities._io.sign_command(testnet, node)
+    assert "-out-qr" in entities._io.ca_command(testnet)
+    open(qr, "w").close()
+    testnet.qr_code(node)
+    assert len(testnet.backend.calls) == 1
+    testnet.qr = False
+    entities._io.node_outputs(testnet, node, rm_exist=True)
+    assert not os.path.exists(qr)